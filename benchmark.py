@@ -0,0 +1,213 @@
+"""
+Benchmarks for the simulation, scoring and generation hot paths, on fixed seeds and fixed room corpora.
+
+    python benchmark.py                          # run everything, print results
+    python benchmark.py --out baseline.json      # ... and save them
+    python benchmark.py --compare baseline.json  # ... and diff against a saved run
+
+Rates are per wall-clock second, so only compare runs made on the same machine.
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import lasercats
+from lasercats_batch import BatchRooms, run_lots_batched
+from lasercats_fast import FastRoom
+from lasercats_golden import legacy_grid
+
+SEED = 12345
+ROOM_SIZES = [5, 7, 9]
+MIRROR_PROBS = [0.4, 0.6, 0.8]
+LASERS_PER_ROOM = 12
+# A rate is reported as a regression if it drops by more than this fraction against the baseline.
+REGRESSION_THRESHOLD = 0.1
+
+
+def room_corpus(n, size, mirror_prob):
+    return lasercats.random_start_arrays(n, size, mirror_prob, rng=np.random.default_rng(SEED))
+
+
+def _fire_single(make_room, corpus):
+    steps = 0
+    for start_array in corpus:
+        room = make_room(start_array)
+        for _ in range(LASERS_PER_ROOM):
+            steps += len(room.launch_laser())
+    return steps
+
+
+def _fire_batch(corpus):
+    rooms = BatchRooms(start_arrays=corpus)
+    for _ in range(LASERS_PER_ROOM):
+        rooms.launch_laser()
+    return int(sum(lengths.sum() for lengths in rooms.path_lengths))
+
+
+SIMULATION_ENGINES = {
+    "room": lambda corpus: _fire_single(lambda a: lasercats.Room(start_array=a), corpus),
+    "fast_room": lambda corpus: _fire_single(lambda a: FastRoom(start_array=a), corpus),
+    "batch": _fire_batch,
+    "legacy_grid": lambda corpus: _fire_single(legacy_grid, corpus),
+}
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def _peak_memory(fn, *args):
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_simulation(n_rooms):
+    """
+    Fires LASERS_PER_ROOM lasers in every room of each corpus with each engine (Path.run / launch_laser).
+    """
+    results = {}
+    for size in ROOM_SIZES:
+        for mirror_prob in MIRROR_PROBS:
+            corpus = room_corpus(n_rooms, size, mirror_prob)
+            for name, engine in SIMULATION_ENGINES.items():
+                steps, elapsed = _timed(engine, corpus)
+                results[f"simulate/{name}/size={size}/p={mirror_prob}"] = {
+                    "steps_per_sec": steps / elapsed,
+                    "paths_per_sec": n_rooms * LASERS_PER_ROOM / elapsed,
+                    "rooms_per_sec": n_rooms / elapsed,
+                    "peak_memory_bytes": _peak_memory(engine, corpus[:max(1, n_rooms // 10)]),
+                }
+    return results
+
+
+def bench_launch_lotsa_lasers(n_rooms, min_difficulty=6):
+    """
+    launch_lotsa_lasers including heuristic scoring and filtering, on the 5x5 corpus.
+    """
+    results = {}
+    corpus = room_corpus(n_rooms, 5, 0.6)
+    for name, room_class in (("room", lasercats.Room), ("fast_room", FastRoom)):
+        accepted = []
+        def run(corpus):
+            for start_array in corpus:
+                room = room_class(start_array=start_array)
+                room.launch_lotsa_lasers(LASERS_PER_ROOM, accepted.append, min_heuristic_breakin_score=min_difficulty)
+        _, elapsed = _timed(run, corpus)
+        results[f"launch_lotsa_lasers/{name}"] = {
+            "rooms_per_sec": n_rooms / elapsed,
+            "accepted_per_sec": len(accepted) / elapsed,
+        }
+    return results
+
+
+def bench_generation(n_rooms, min_difficulty=6):
+    """
+    End-to-end run_lots (random rooms included) and make_puzzle.
+    """
+    results = {}
+    for name, room_class in (("room", lasercats.Room), ("fast_room", FastRoom)):
+        accepted = []
+        np.random.seed(SEED)
+        _, elapsed = _timed(lasercats.run_lots, n_rooms, LASERS_PER_ROOM, accepted.append, min_difficulty, room_class)
+        results[f"run_lots/{name}"] = {
+            "rooms_per_sec": n_rooms / elapsed,
+            "accepted_per_sec": len(accepted) / elapsed,
+        }
+    accepted = []
+    _, elapsed = _timed(run_lots_batched, n_rooms, LASERS_PER_ROOM, accepted.append, min_difficulty, 4096,
+                        np.random.default_rng(SEED))
+    results["run_lots/batch"] = {
+        "rooms_per_sec": n_rooms / elapsed,
+        "accepted_per_sec": len(accepted) / elapsed,
+    }
+
+    np.random.seed(SEED)
+    n_puzzles = 5
+    with contextlib.redirect_stdout(io.StringIO()): # make_puzzle prints every failed try.
+        _, elapsed = _timed(lambda: [lasercats.make_puzzle(min_difficulty=min_difficulty) for _ in range(n_puzzles)])
+    results["make_puzzle"] = {"accepted_per_sec": n_puzzles / elapsed}
+    return results
+
+
+def run_all(quick=False):
+    n_rooms = 100 if quick else 1000
+    results = {}
+    results.update(bench_simulation(n_rooms))
+    results.update(bench_launch_lotsa_lasers(n_rooms))
+    results.update(bench_generation(n_rooms))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "node": platform.node(),
+            "quick": quick,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Returns a list of (benchmark, metric, baseline value, current value, ratio, is_regression).
+    Higher is better for every *_per_sec metric and worse for memory.
+    """
+    rows = []
+    for name, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            old = baseline["results"].get(name, {}).get(metric)
+            if not old:
+                continue
+            ratio = value / old
+            if metric.endswith("_per_sec"):
+                regression = ratio < 1 - threshold
+            else:
+                regression = ratio > 1 + threshold
+            rows.append((name, metric, old, value, ratio, regression))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller corpora, for a fast smoke test")
+    parser.add_argument("--out", help="save results as JSON here")
+    parser.add_argument("--compare", help="JSON from an earlier run to diff against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    current = run_all(quick=args.quick)
+    for name, metrics in current["results"].items():
+        print(name.ljust(48), "  ".join("{}={:.4g}".format(k, v) for k, v in metrics.items()))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(current, baseline, args.threshold)
+        regressions = [row for row in rows if row[5]]
+        print()
+        for name, metric, old, value, ratio, regression in rows:
+            print("{} {} {}: {:.4g} -> {:.4g} ({:.2f}x)".format(
+                "REGRESSION" if regression else "          ", name, metric, old, value, ratio))
+        print("\n{} regressions out of {} metrics".format(len(regressions), len(rows)))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
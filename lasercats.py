@@ -1,8 +1,11 @@
 import numpy as np
 from collections import Counter
+import copy
 import os
+import time
 
-MAX_PATH_LEN = 99
+MAX_PATH_LEN = 99 # for a 5x5 room; see max_path_len
+MAX_BREAKIN_MARKS_PER_PATH = 5 # most cells Path.fillin_breakin_heuristic_grid marks (a length-5 path straight back)
 
 NORTH = np.array((0, -1))
 SOUTH = np.array((0, 1))
@@ -13,11 +16,22 @@ directions = [NORTH, EAST, SOUTH, WEST]
 def dir_array_to_idx(dir_array):
     return [np.all(dir == dir_array) for dir in directions].index(True)
 
-def ending_side(end_location):
+def max_path_len(size):
+    """
+    Paths longer than this are cut short (see Path.truncated). MAX_PATH_LEN for a 5x5 room, and the same
+    4 cells per site beyond that, since path lengths grow with the room's area.
+    """
+    return max(MAX_PATH_LEN, 4 * size * size - 1)
+
+def ending_side(end_location, size=5):
     if end_location[0] == -1: return 3 # West
     if end_location[1] == -1: return 0 # North
-    if end_location[0] == 5: return 1 # East
-    if end_location[1] == 5: return 2 # South
+    if end_location[0] == size: return 1 # East
+    if end_location[1] == size: return 2 # South
+
+def is_midgame_length(length):
+    # The path lengths heuristic_midgame_score counts.
+    return 5 < length < 12
 
 def direction_str(i):
     if i % 4 == 0: return "^"
@@ -38,6 +52,54 @@ class BREAKIN_VALUE():
     BACK_6_CENTER = 4 # guarantees 3, 2 options for 3 more.
     BACK_6_EDGE = 1 # guarantees 1, 4 options for 5.
 
+# The 8 symmetries of a room which keep the human in the middle: mirror east-west if `mirrored`,
+# then rotate k quarter turns clockwise.
+SYMMETRIES = [(k, mirrored) for mirrored in (False, True) for k in range(4)]
+DEFAULT_LAUNCH_ORDER = (0, 1, 2, 3)
+
+def transform_direction_idx(dir_idx, symmetry):
+    k, mirrored = symmetry
+    if mirrored:
+        dir_idx = -dir_idx % 4
+    return (dir_idx + k) % 4
+
+def transform_array(array, symmetry):
+    """
+    Image of a terrain array (indexed [x, y]) under a symmetry. Mirroring and quarter turns each swap UL and UR.
+    """
+    k, mirrored = symmetry
+    array = np.array(array)
+    if mirrored:
+        array = array[::-1, :]
+    for _ in range(k):
+        array = array[:, ::-1].T
+    if (k % 2 == 1) != mirrored:
+        array = np.choose(array, [Terrain.FLAT, Terrain.UR, Terrain.UL, Terrain.HUMAN])
+    return np.array(array)
+
+def fingerprint(start_array, launch_order=DEFAULT_LAUNCH_ORDER, num_paths=None):
+    """
+    A hex string which is the same for a room and all of its mirror/rotation images.
+
+    An image of a room is only the same puzzle if its lasers are fired in the image of the launch order too
+    (a room turned a quarter clockwise must fire east first, then south, ...), so the launch order is part of what
+    gets transformed. Include num_paths to fingerprint a puzzle (room plus where the clues stop) rather than a room.
+    """
+    encodings = []
+    for symmetry in SYMMETRIES:
+        array = transform_array(start_array, symmetry)
+        order = [transform_direction_idx(d, symmetry) for d in launch_order]
+        code = 0
+        for terrain in array.ravel():
+            code = code * 4 + int(terrain)
+        for d in order:
+            code = code * 4 + d
+        encodings.append(code)
+    result = "%x" % min(encodings)
+    if num_paths is not None:
+        result += "-%d" % num_paths
+    return result
+
 class Terrain():
     FLAT = 0
     UL = 1
@@ -52,32 +114,91 @@ class Terrain():
         if terrain == Terrain.HUMAN: return "H"
         raise ValueError("Invalid Terrain {}".format(terrain))
 
+def random_terrain(shape, mirror_prob=0.6, rng=None):
+    """
+    Draws starting terrain for an array of cells in one vectorized call: FLAT with probability 1 - mirror_prob,
+    otherwise UL or UR with equal odds. One uniform draw per cell, so drawing many layouts at once gives the
+    same layouts as drawing them one after another.
+    :param rng: a np.random.Generator. Defaults to the global np.random state.
+    """
+    if rng is None:
+        rng = np.random
+    u = rng.random(shape)
+    return np.where(u > mirror_prob, Terrain.FLAT, np.where(u < mirror_prob / 2, Terrain.UL, Terrain.UR))
+
+def random_start_arrays(n, size=5, mirror_prob=0.6, rng=None, dtype=int):
+    """
+    Draws n room layouts at once, as an (n, size, size) array with the human in the middle.
+    """
+    arrays = random_terrain((n, size, size), mirror_prob, rng).astype(dtype)
+    midpt = int((size - 1) / 2)
+    arrays[:, midpt, midpt] = Terrain.HUMAN
+    return arrays
+
+def pack_layout(array):
+    """
+    A room layout as bytes, 2 bits per cell: cell x * size + y is bits 2 * cell and 2 * cell + 1, little-endian.
+    """
+    cells = np.asarray(array, dtype=np.uint8).ravel()
+    cells = np.concatenate([cells, np.zeros(-len(cells) % 4, dtype=np.uint8)])
+    return (cells[0::4] | cells[1::4] << 2 | cells[2::4] << 4 | cells[3::4] << 6).tobytes()
+
+def unpack_layout(data, size):
+    packed = np.frombuffer(data, dtype=np.uint8)
+    cells = np.stack([packed & 3, packed >> 2 & 3, packed >> 4 & 3, packed >> 6], axis=1).ravel()
+    return cells[:size * size].astype(int).reshape(size, size)
+
 class Room():
-    def __init__(self, size=5, mirror_prob=0.6):
-        self.size = size
-        self.array = np.array(
-            [[Room._new_cell(mirror_prob)
-            for _ in range(size)] for _ in range(size)]
-        )
+    def __init__(self, size=5, mirror_prob=0.6, start_array=None, rng=None, launch_order=DEFAULT_LAUNCH_ORDER):
+        """
+        :param start_array: if given, use this layout instead of drawing a random one (size is taken from it).
+        :param rng: a np.random.Generator to draw the layout from. Defaults to the global np.random state.
+        :param launch_order: the direction indices the human cycles through when firing. The puzzle always uses
+            north, east, south, west; other orders are for replaying mirror/rotation images of a room.
+        """
+        if start_array is None:
+            start_array = random_start_arrays(1, size, mirror_prob, rng)[0]
+        array = np.array(start_array)
+        self.size = len(array)
         midpt = int((self.size - 1) / 2)
         self.human_location = (midpt, midpt)
-        self.array[(midpt, midpt)] = Terrain.HUMAN
+        array[(midpt, midpt)] = Terrain.HUMAN
+        self.array = array
 
-        self.start_array = np.array(self.array)
+        self.start_array = np.array(array)
+        self.max_path_len = max_path_len(self.size)
 
         self.paths = []
+        self.launch_order = tuple(launch_order)
         self.next_direction_dx = 0
         self.visited_locs = np.zeros(shape=(self.size, self.size), dtype=np.bool)
         self.possible_extractions = [] # tuple of path index, path length, answer index
         self.breakin_heuristic_grid = np.zeros(shape=(self.size, self.size), dtype=np.bool)
+        # Running totals of visited_locs and breakin_heuristic_grid, kept up to date as paths visit and mark cells,
+        # so that checking them after every laser doesn't cost a pass over the whole room.
+        self.num_sites_visited = 0
+        self.heuristic_breakin_score = 0
+        self.heuristic_midgame_score = 0 # paths with is_midgame_length
 
-    @classmethod
-    def _new_cell(self, mirror_prob):
-        # Only called in __init__
-        if np.random.random() > mirror_prob:
-            return Terrain.FLAT
-        else:
-            return np.random.choice((Terrain.UL, Terrain.UR))
+    def reset(self, start_array):
+        """
+        Puts the room back to before any laser was fired, with a new starting layout of the same size, reusing the
+        room's arrays instead of allocating new ones. See RoomPool.
+        """
+        self.start_array[...] = start_array
+        self.start_array[self.human_location] = Terrain.HUMAN
+        self._reset_board()
+        self.breakin_heuristic_grid[...] = False
+        self.num_sites_visited = 0
+        self.heuristic_breakin_score = 0
+        self.heuristic_midgame_score = 0
+        self.paths = []
+        self.next_direction_dx = 0
+        self.possible_extractions = []
+
+    def _reset_board(self):
+        self.array[...] = self.start_array
+        self.visited_locs[...] = False
 
     def display(self):
         """
@@ -93,34 +214,118 @@ class Room():
         assert len(location) == 2
         return 0 <= location[0] < self.size and 0 <= location[1] < self.size
 
+    def visit(self, location):
+        """
+        Marks a cell visited. Returns whether it had been visited already.
+        """
+        if self.visited_locs[location]:
+            return True
+        self.visited_locs[location] = True
+        self.num_sites_visited += 1
+        return False
+
+    def mark_breakin(self, location):
+        if not self.breakin_heuristic_grid[location]:
+            self.breakin_heuristic_grid[location] = True
+            self.heuristic_breakin_score += 1
+
+    def _recount(self):
+        # After visited_locs, breakin_heuristic_grid or paths have been replaced wholesale.
+        self.num_sites_visited = int(np.sum(self.visited_locs))
+        self.heuristic_breakin_score = int(np.sum(self.breakin_heuristic_grid))
+        self.heuristic_midgame_score = sum(1 for p in self.paths if is_midgame_length(len(p)))
+
     def flip_mirror(self, location):
         assert self.array[location] in (Terrain.UL, Terrain.UR)
         self.array[location] = Terrain.UL if self.array[location] == Terrain.UR else Terrain.UR
 
-    def launch_laser(self):
-        direction = directions[self.next_direction_dx]
-        path = Path(self, direction)
-        path.run()
+    def _new_path(self, direction):
+        return Path(self, direction)
+
+    def launch_laser(self, stats=None):
+        direction = directions[self.launch_order[self.next_direction_dx]]
+        path = self._new_path(direction)
+        if stats is None:
+            path.run()
+            path.fillin_breakin_heuristic_grid()
+        else:
+            with stats.timer("simulate"):
+                path.run()
+            with stats.timer("heuristics"):
+                path.fillin_breakin_heuristic_grid()
         self.paths.append(path)
+        if is_midgame_length(len(path)):
+            self.heuristic_midgame_score += 1
         self.next_direction_dx += 1
-        self.next_direction_dx = self.next_direction_dx % len(directions)
+        self.next_direction_dx = self.next_direction_dx % len(self.launch_order)
         return path
 
-    @property
-    def all_sites_visited(self):
-        return np.all(self.visited_locs)
+    def save_state(self):
+        """
+        Everything launching more lasers changes, for restore_state to roll the room back to.
+        """
+        return (np.array(self.array), np.array(self.visited_locs), np.array(self.breakin_heuristic_grid),
+                len(self.paths), self.next_direction_dx)
 
-    @property
-    def heuristic_breakin_score(self):
-        return np.sum(self.breakin_heuristic_grid)
+    def restore_state(self, state):
+        """
+        Rolls the room back to a save_state() from earlier in the same run of lasers, dropping later paths.
+        """
+        array, visited_locs, breakin_heuristic_grid, num_paths, self.next_direction_dx = state
+        self.array = np.array(array)
+        self.visited_locs = np.array(visited_locs)
+        self.breakin_heuristic_grid = np.array(breakin_heuristic_grid)
+        del self.paths[num_paths:]
+        self._recount()
+
+    def patch_state(self, state, location, terrain):
+        """
+        A save_state() with a cell that was unvisited at the time changed, as if set_unvisited_cell came first.
+        """
+        array = np.array(state[0])
+        array[location] = terrain
+        return (array,) + state[1:]
+
+    def set_unvisited_cell(self, location, terrain):
+        """
+        Changes the starting terrain of a cell no laser has visited yet (so its current terrain changes too).
+        """
+        assert not self.visited_locs[location]
+        self.start_array[location] = terrain
+        self.array[location] = terrain
+
+    def fork(self, mirror_prob=0.6, rng=None):
+        """
+        A copy of this room, lasers and all, with every cell no laser has visited yet drawn afresh. Earlier paths
+        never read those cells, so they're exactly what they would have been in the new room.
+        """
+        child = copy.copy(self)
+        visited_locs = np.array(self.visited_locs)
+        unvisited = ~visited_locs
+        unvisited[self.human_location] = False
+        start_array, array = np.array(self.start_array), np.array(self.array)
+        fresh = random_terrain(int(np.sum(unvisited)), mirror_prob, rng)
+        start_array[unvisited] = fresh
+        array[unvisited] = fresh
+        child.start_array = start_array
+        child.array = array
+        child.visited_locs = visited_locs
+        child.breakin_heuristic_grid = np.array(self.breakin_heuristic_grid)
+        child.possible_extractions = list(self.possible_extractions)
+        child.paths = []
+        for path in self.paths:
+            path = copy.copy(path)
+            path.room = child
+            child.paths.append(path)
+        return child
 
     @property
-    def heuristic_midgame_score(self):
-        return len([p for p in self.paths if 5 < len(p) < 12])
+    def all_sites_visited(self):
+        return self.num_sites_visited == self.size * self.size
 
     def launch_lotsa_lasers(self, max_lasers, valid_puzzle_found_callback=None,
                             only_extract_after_all_visited=True, min_heuristic_breakin_score=6, min_heuristic_midgame_score=4,
-                            stop_after_complete=False):
+                            stop_after_complete=False, stats=None, grader=None, prune=True):
         """
 
         :param max_lasers: launch up to this many lasers (but maybe stop early if valid_puzzle_found_callback() returns True).
@@ -131,27 +336,81 @@ class Room():
         :param min_heuristic_breakin_score: only accept rooms which have at least this many cells that can be determined
             entirely right at the start.
         :param stop_after_complete: If True, stop after finding a valid room.
+        :param stats: optional lasercats_stats.LaserStats, which counts why candidate final paths were rejected
+            and times each stage.
+        :param grader: optional lasercats_grader.Grader. If given, min_heuristic_breakin_score applies to the
+            breakin_score of its deduction grade rather than to heuristic_breakin_score (after the grader's own
+            min_heuristic_breakin_score, if it has one).
+        :param prune: stop firing as soon as the lasers left can't bring the room up to min_heuristic_breakin_score
+            and min_heuristic_midgame_score. No valid puzzle is lost, but the room may end up with fewer paths.
         :return:
         """
         if valid_puzzle_found_callback is None:
             valid_puzzle_found_callback = lambda x: True
+        for _ in self.iter_final_paths(max_lasers, only_extract_after_all_visited, min_heuristic_breakin_score,
+                                       min_heuristic_midgame_score, stats=stats, grader=grader, prune=prune):
+            valid_room_puzzle = _check_room(valid_puzzle_found_callback, self, stats)
+            if valid_room_puzzle and stop_after_complete:
+                return
+
+    def iter_final_paths(self, max_lasers, only_extract_after_all_visited=True, min_heuristic_breakin_score=6,
+                         min_heuristic_midgame_score=4, stats=None, grader=None, prune=True):
+        """
+        Launches up to max_lasers lasers, and yields the room (with the candidate final path in paths[-1]) after each
+        one which passes the heuristic filters. Everything else is as in launch_lotsa_lasers, which just calls
+        valid_puzzle_found_callback on each room this yields.
+        Lasers are only launched as the generator is advanced, so stopping early leaves the room at that path.
+        """
         for i in range(max_lasers):
+            # A laser adds at most MAX_BREAKIN_MARKS_PER_PATH to heuristic_breakin_score and 1 to
+            # heuristic_midgame_score, so once the lasers left can't reach the minimums, no later path can pass.
+            # (A grader's breakin_score has no such bound, but the heuristic one it pre-filters on does.)
+            lasers_left = max_lasers - i
+            breakin_floor = min_heuristic_breakin_score if grader is None else grader.min_heuristic_breakin_score
+            if prune and (self.heuristic_midgame_score + lasers_left < min_heuristic_midgame_score
+                          or breakin_floor is not None and self.heuristic_breakin_score
+                          + MAX_BREAKIN_MARKS_PER_PATH * lasers_left < breakin_floor):
+                if stats is not None:
+                    stats.pruned += 1
+                return
             all_sites_visited_before_this_laser = self.all_sites_visited
-            path = self.launch_laser()
+            path = self.launch_laser(stats)
+            if stats is not None:
+                stats.record_path(path)
 
             # Can't end the puzzle before all cells which are used in the final (unknown to solver) path
             # have been visited earlier in the puzzle
-            if not path.all_locations_already_visited: continue
+            if not path.all_locations_already_visited:
+                if stats is not None:
+                    stats.reject("path_not_visited")
+                continue
             # If only_extract_after_all_visited, we can't finish until all cells in the grid
             # have been visited earlier in the puzzle. (This is a stricter criterion than path.all_locations_already_visited)
-            if only_extract_after_all_visited and not all_sites_visited_before_this_laser: continue
+            if only_extract_after_all_visited and not all_sites_visited_before_this_laser:
+                if stats is not None:
+                    stats.reject("room_not_visited")
+                continue
+            if self.heuristic_midgame_score < min_heuristic_midgame_score:
+                if stats is not None:
+                    stats.reject("midgame_score")
+                continue
             # If the heuristic_breakin_score is less than min_heuristic_breakin_score, it won't be possible.
-            if self.heuristic_breakin_score < min_heuristic_breakin_score: continue
-            if self.heuristic_midgame_score < min_heuristic_midgame_score: continue
-
-            valid_room_puzzle = valid_puzzle_found_callback(self)
-            if valid_room_puzzle and stop_after_complete:
-                return
+            # Checked last, since grading with a grader costs a solve.
+            if grader is None:
+                breakin_score = self.heuristic_breakin_score
+            elif stats is None:
+                breakin_score = grader.breakin_score(self)
+            else:
+                with stats.timer("grade"):
+                    breakin_score = grader.breakin_score(self)
+            if stats is not None:
+                stats.breakin_scores[int(breakin_score)] += 1
+            if breakin_score < min_heuristic_breakin_score:
+                if stats is not None:
+                    stats.reject("breakin_score")
+                continue
+
+            yield self
 
     def pretty_print_puzzle(self):
         result = "="*16
@@ -161,8 +420,12 @@ class Room():
             result += p.pretty_print_puzzle()
         return result
 
+    def fingerprint(self, num_paths=None):
+        return fingerprint(self.start_array, self.launch_order, num_paths=num_paths)
+
     def dump_puzzle(self, dir):
-        name = "-".join([str(len(p)) for p in self.paths[:-1]]) + '.txt'
+        # The fingerprint keeps different puzzles with the same path lengths from overwriting each other.
+        name = "-".join([str(len(p)) for p in self.paths[:-1]]) + f"_{self.fingerprint(len(self.paths))}.txt"
         name = f"H={self.heuristic_breakin_score}_" + name
         with open(os.path.join(dir, name), 'w') as f:
             f.write(self.pretty_print_puzzle())
@@ -180,6 +443,13 @@ class Path():
     def __len__(self):
         return len(self.locations)
 
+    @property
+    def truncated(self):
+        """
+        True if the path was stopped at room.max_path_len cells instead of reaching a wall (see run).
+        """
+        return len(self) > self.room.max_path_len
+
     def __repr__(self):
         return "<Path  of length {} now at {} pointing {}>".format(len(self), self.cursor_location, self.cursor_direction)
 
@@ -191,8 +461,8 @@ class Path():
             self.done = True
             return
         # print("Cursor at {}".format(self.cursor_location))
-        self.all_locations_already_visited = self.all_locations_already_visited and self.room.visited_locs[self.cursor_location]
-        self.room.visited_locs[self.cursor_location] = True
+        already_visited = self.room.visit(self.cursor_location)
+        self.all_locations_already_visited = self.all_locations_already_visited and already_visited
         terrain = self.room.array[self.cursor_location]
         # print("Terrain is {}".format(terrain))
         if terrain == Terrain.UL or terrain == Terrain.UR:
@@ -208,11 +478,16 @@ class Path():
         self.locations.append(self.cursor_location)
 
     def run(self):
+        # Every beam reaches a wall eventually; it can't loop forever. If it did, take the westmost of the
+        # northmost cells it visits over and over. The beam can only enter that cell heading north or west, and
+        # must leave it heading south or east, so it's a mirror which has to be "/" every time the beam hits it;
+        # but every hit flips it. So max_path_len only ever cuts short a long path (see truncated), never a loop,
+        # and there's no need to look for cycles.
+        max_len = self.room.max_path_len
         while not self.done:
             self.advance()
-            if len(self) > MAX_PATH_LEN:
+            if len(self) > max_len:
                 self.done = True
-        self.fillin_breakin_heuristic_grid()
 
     @property
     def contains_dups(self):
@@ -225,93 +500,330 @@ class Path():
         return False
 
     def fillin_breakin_heuristic_grid(self):
-        end_side = ending_side(self.cursor_location)
-        if end_side is None: return
+        end_side = ending_side(self.cursor_location, self.room.size)
+        if end_side is None: return # truncated
         is_same_side = self.launch_dir_idx == end_side
         is_opposite_side = (self.launch_dir_idx - end_side) % 4 == 2
         is_perpendicular_side = (self.launch_dir_idx - end_side) % 2 == 1
-        lands_in_middle = 2 in set(self.cursor_location)
+        lands_in_middle = self.room.human_location[0] in set(self.cursor_location)
+        mark = self.room.mark_breakin
 
         if len(self) == 2:
             for loc in self.locations:
-                self.room.breakin_heuristic_grid[loc] = True
+                mark(loc)
         elif len(self) == 3:
             if is_perpendicular_side:
                 for loc in self.locations:
-                    self.room.breakin_heuristic_grid[loc] = True
+                    mark(loc)
         elif len(self) == 4:
             if is_same_side and lands_in_middle:
-                self.room.breakin_heuristic_grid[self.locations[0]] = True
-                self.room.breakin_heuristic_grid[self.locations[3]] = True
+                mark(self.locations[0])
+                mark(self.locations[3])
             if is_perpendicular_side and lands_in_middle:
-                self.room.breakin_heuristic_grid[self.locations[0]] = True
+                mark(self.locations[0])
         elif len(self) == 5:
             if is_same_side:
-                self.room.breakin_heuristic_grid[self.locations[0]] = True
-                self.room.breakin_heuristic_grid[self.locations[4]] = True
-                # print(self.room.breakin_heuristic_grid)
+                mark(self.locations[0])
+                mark(self.locations[4])
             elif is_opposite_side:
                 for loc in self.locations:
-                    self.room.breakin_heuristic_grid[loc] = True
+                    mark(loc)
             elif is_perpendicular_side:
                 pass
                 # TODO
         elif len(self) == 6:
             if is_opposite_side and lands_in_middle:
-                self.room.breakin_heuristic_grid[self.locations[0]] = True
-                self.room.breakin_heuristic_grid[self.locations[1]] = True
-                self.room.breakin_heuristic_grid[self.locations[2]] = True
+                mark(self.locations[0])
+                mark(self.locations[1])
+                mark(self.locations[2])
             if is_opposite_side and not lands_in_middle:
-                self.room.breakin_heuristic_grid[self.locations[0]] = True
+                mark(self.locations[0])
 
     def pretty_print_puzzle(self):
         result = ""
+        size = self.room.size
         len_str = '%02d' % len(self)
+        margin = " " * len(len_str)
         end_location = self.cursor_location
         if end_location[1] == -1:
             x_coord = end_location[0]
-            result += "\n" + "   " + "  "*x_coord + len_str + "  "*(self.room.size - x_coord - 1) +"   "
-        result += "\n" + "  +" + "--" * self.room.size + "+  "
-        for i in range(self.room.size):
-            row_str = "|" + "  " * self.room.size + "|"
-            if i == 2:
-                row_str = row_str[:5] + direction_str(self.launch_dir_idx)*2 + row_str[7:]
-            left = len_str if end_location[0] == -1 and end_location[1] == i else "  "
-            right = len_str if end_location[0] == self.room.size and end_location[1] == i else "  "
+            result += "\n" + margin + " " + "  "*x_coord + len_str + "  "*(size - x_coord - 1) + " " + margin
+        result += "\n" + margin + "+" + "--" * size + "+" + margin
+        midpt = self.room.human_location[0]
+        for i in range(size):
+            row_str = "|" + "  " * size + "|"
+            if i == midpt:
+                row_str = row_str[:1 + 2 * midpt] + direction_str(self.launch_dir_idx)*2 + row_str[3 + 2 * midpt:]
+            left = len_str if end_location[0] == -1 and end_location[1] == i else margin
+            right = len_str if end_location[0] == size and end_location[1] == i else margin
             result += "\n" + left + row_str + right
-        result += "\n" + "  +" + "--" * self.room.size + "+  "
-        if end_location[1] == 5:
+        result += "\n" + margin + "+" + "--" * size + "+" + margin
+        if end_location[1] == size:
             x_coord = end_location[0]
-            result += "\n" + "   " + "  "*x_coord + len_str + "  "*(self.room.size - x_coord - 1) +"   "
+            result += "\n" + margin + " " + "  "*x_coord + len_str + "  "*(size - x_coord - 1) + " " + margin
         return result
     
-def make_room(max_paths, valid_puzzle_found_callback, min_difficulty=6, retry_until_successful=False):
+class PuzzleRecord():
+    """
+    A compact, picklable summary of an accepted room, used to keep or ship results instead of whole Rooms.
+    The starting layout is packed 2 bits per cell and the paths are one flat array of cell indices (x * size + y),
+    a few hundred bytes in all. The room is deterministic given its start_array, so `to_room` rebuilds it exactly
+    by replaying the lasers, for when it's needed for rendering.
+    """
+    __slots__ = ("size", "layout", "num_paths", "lengths", "ends", "cells", "heuristic_breakin_score",
+                 "heuristic_midgame_score", "room_index", "launch_order", "answer_index", "letter")
+
+    def __init__(self, start_array, num_paths, path_lengths, end_locations, heuristic_breakin_score,
+                 heuristic_midgame_score, room_index=None, launch_order=DEFAULT_LAUNCH_ORDER,
+                 answer_index=None, letter=None, path_cells=None):
+        """
+        :param path_cells: optional flat list of the cells (x * size + y) of every path, one after another.
+        """
+        self.size = len(start_array)
+        self.layout = pack_layout(start_array)
+        self.num_paths = num_paths # The final (to-be-solved-for) path is paths[num_paths - 1].
+        self.lengths = np.asarray(path_lengths, dtype=np.uint16).tobytes()
+        self.ends = np.asarray(end_locations, dtype=np.int8).tobytes()
+        self.cells = None if path_cells is None else np.asarray(path_cells, dtype=np.uint16).tobytes()
+        self.heuristic_breakin_score = heuristic_breakin_score
+        self.heuristic_midgame_score = heuristic_midgame_score
+        self.room_index = room_index
+        self.launch_order = tuple(launch_order)
+        self.answer_index = answer_index # Where the final path's letter goes in the answer, if extracted.
+        self.letter = letter
+
+    def __repr__(self):
+        return "<PuzzleRecord room {} with {} paths, easiness {}>".format(
+            self.room_index, self.num_paths, self.heuristic_breakin_score)
+
+    @property
+    def start_array(self):
+        return unpack_layout(self.layout, self.size)
+
+    @property
+    def path_lengths(self):
+        return np.frombuffer(self.lengths, dtype=np.uint16).tolist()
+
+    @property
+    def end_locations(self):
+        return [tuple(loc) for loc in np.frombuffer(self.ends, dtype=np.int8).reshape(-1, 2).tolist()]
+
+    def path_locations(self, i):
+        """
+        The (x, y) cells of path i, from the stored cells if there are any, else by replaying the room.
+        """
+        if self.cells is None:
+            return [tuple(int(c) for c in loc) for loc in self.to_room().paths[i].locations]
+        start = sum(self.path_lengths[:i])
+        cells = np.frombuffer(self.cells, dtype=np.uint16)[start:start + self.path_lengths[i]]
+        return [divmod(int(c), self.size) for c in cells]
+
+    @classmethod
+    def from_room(cls, room, room_index=None, answer_index=None, letter=None):
+        return cls(
+            start_array=room.start_array,
+            num_paths=len(room.paths),
+            path_lengths=[len(p) for p in room.paths],
+            end_locations=[tuple(int(c) for c in p.cursor_location) for p in room.paths],
+            heuristic_breakin_score=int(room.heuristic_breakin_score),
+            heuristic_midgame_score=int(room.heuristic_midgame_score),
+            room_index=room_index,
+            launch_order=room.launch_order,
+            answer_index=answer_index,
+            letter=letter,
+            path_cells=[int(x) * room.size + int(y) for p in room.paths for x, y in p.locations],
+        )
+
+    def to_room(self, room_class=Room):
+        room = room_class(start_array=self.start_array, launch_order=self.launch_order)
+        for _ in range(self.num_paths):
+            room.launch_laser()
+        return room
+
+    def fingerprint(self):
+        return fingerprint(self.start_array, self.launch_order, num_paths=self.num_paths)
+
+    def to_dict(self):
+        """
+        JSON-friendly version of the record.
+        """
+        return {
+            "start_array": self.start_array.tolist(),
+            "num_paths": self.num_paths,
+            "path_lengths": self.path_lengths,
+            "end_locations": [list(loc) for loc in self.end_locations],
+            "heuristic_breakin_score": self.heuristic_breakin_score,
+            "heuristic_midgame_score": self.heuristic_midgame_score,
+            "room_index": self.room_index,
+            "launch_order": list(self.launch_order),
+            "answer_index": None if self.answer_index is None else int(self.answer_index),
+            "letter": self.letter,
+            "path_cells": None if self.cells is None else np.frombuffer(self.cells, dtype=np.uint16).tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        d = dict(d)
+        d["start_array"] = np.array(d["start_array"])
+        d["end_locations"] = [tuple(loc) for loc in d["end_locations"]]
+        return cls(**d)
+
+class RoomPool():
+    """
+    A fixed set of rooms which are reset and reused, for churning through lots of short-lived rooms without
+    allocating new ones. Layouts for a whole batch of rooms are drawn in one vectorized call, giving the same
+    layouts (for the same rng) as making the rooms one at a time.
+    A room is only valid until the pool hands it out again, so keep a PuzzleRecord rather than the room itself.
+    """
+    def __init__(self, pool_size=256, size=5, mirror_prob=0.6, rng=None, room_class=Room):
+        self.size = size
+        self.mirror_prob = mirror_prob
+        self.rng = rng
+        self.rooms = [room_class(start_array=np.zeros((size, size), dtype=int)) for _ in range(pool_size)]
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def draw(self, n=None):
+        """
+        Resets the first n rooms (default: all of them) with freshly drawn layouts and returns them.
+        """
+        n = len(self.rooms) if n is None else n
+        start_arrays = random_start_arrays(n, self.size, self.mirror_prob, self.rng)
+        for room, start_array in zip(self.rooms, start_arrays):
+            room.reset(start_array)
+        return self.rooms[:n]
+
+    def iter_rooms(self, num_rooms=None):
+        """
+        Yields num_rooms freshly drawn rooms (forever, if None), drawing len(self) layouts at a time.
+        """
+        remaining = num_rooms
+        while remaining is None or remaining > 0:
+            n = len(self.rooms) if remaining is None else min(len(self.rooms), remaining)
+            yield from self.draw(n)
+            if remaining is not None:
+                remaining -= n
+
+def make_room(max_paths, valid_puzzle_found_callback, min_difficulty=6, retry_until_successful=False, room_class=Room,
+              stats=None, grader=None):
     """
     Makes a room and runs it forwards. May or may not result in a valid puzzle.
+    :param room_class: Room, or a faster backend with the same API such as lasercats_fast.FastRoom.
+    :param stats: optional lasercats_stats.LaserStats to record into (see Room.launch_lotsa_lasers).
+    :param grader: optional lasercats_grader.Grader to measure min_difficulty with (see Room.launch_lotsa_lasers).
     """
-    r = Room()
-    r.launch_lotsa_lasers(max_paths, valid_puzzle_found_callback, min_heuristic_breakin_score=min_difficulty)
+    r = room_class()
+    if stats is not None:
+        stats.rooms += 1
+    r.launch_lotsa_lasers(max_paths, valid_puzzle_found_callback, min_heuristic_breakin_score=min_difficulty,
+                          stats=stats, grader=grader)
     return r
 
-def run_lots(num_rooms, max_paths, valid_puzzle_found_callback, min_difficulty=6):
+def run_lots(num_rooms, max_paths, valid_puzzle_found_callback, min_difficulty=6, room_class=Room, stop_condition=None,
+             stats=None, grader=None):
     """
     valid_puzzle_found_callback has to include outputting the room somewhere, or the data will fall into a void.
+    (iter_puzzles yields the accepted puzzles instead.)
+    :param stop_condition: optional function of no arguments, checked after every room; stop once it returns True.
+    :param stats: optional lasercats_stats.LaserStats, aggregated over every room.
+    :param grader: optional lasercats_grader.Grader to measure min_difficulty with, shared by every room.
     """
     for _ in range(num_rooms):
-        make_room(max_paths, valid_puzzle_found_callback, min_difficulty=min_difficulty)
+        make_room(max_paths, valid_puzzle_found_callback, min_difficulty=min_difficulty, room_class=room_class,
+                  stats=stats, grader=grader)
+        if stop_condition is not None and stop_condition():
+            return
         
-def make_puzzle(min_difficulty=8, max_paths=12, ntries=1000):
-    done = False
-    def valid_puzzle_found_callback(*args):
-        nonlocal done
-        done = True
-
+def run_forking(num_prefixes, max_paths, valid_puzzle_found_callback, min_difficulty=6, prefix_lasers=6,
+                forks_per_prefix=40, min_prefix_breakin_score=6, room_class=Room, rng=None, patience=8):
+    """
+    Prefix-reusing version of run_lots. Fires the first prefix_lasers lasers of a fresh room and, if that prefix
+    already has a heuristic_breakin_score of at least min_prefix_breakin_score, forks it up to forks_per_prefix times
+    (see Room.fork) and runs every fork on to max_paths. Bad prefixes are thrown away as in run_lots.
+    The threshold has to be close to min_difficulty for this to beat run_lots: forking prefixes which are no better
+    than average just spends the time of many rooms on one room's worth of variety.
+    :param patience: stop forking a prefix once this many forks in a row have found no new puzzle, so the forks go
+        to the prefixes which keep giving. None to always run forks_per_prefix forks.
+
+    Forks which don't touch any redrawn cell before a valid final path give the same puzzle, so each distinct
+    puzzle is only passed to valid_puzzle_found_callback once per prefix.
+    """
+    for _ in range(num_prefixes):
+        prefix = room_class(rng=rng)
+        prefix.launch_lotsa_lasers(prefix_lasers, valid_puzzle_found_callback, min_heuristic_breakin_score=min_difficulty,
+                                   prune=False) # The forks carry on from exactly prefix_lasers paths.
+        if prefix.heuristic_breakin_score < min_prefix_breakin_score:
+            continue
+        n_forks = 1 if prefix.all_sites_visited else forks_per_prefix
+
+        seen = set()
+        def callback(room):
+            clues = tuple((len(p), tuple(int(c) for c in p.cursor_location)) for p in room.paths)
+            if clues in seen:
+                return False
+            seen.add(clues)
+            return valid_puzzle_found_callback(room)
+
+        barren = 0 # forks in a row which found nothing new
+        for _ in range(n_forks):
+            num_seen = len(seen)
+            room = prefix.fork(rng=rng)
+            room.launch_lotsa_lasers(max_paths - prefix_lasers, callback, min_heuristic_breakin_score=min_difficulty)
+            barren = 0 if len(seen) > num_seen else barren + 1
+            if patience is not None and barren >= patience:
+                break
+
+def _check_room(valid_puzzle_found_callback, room, stats=None):
+    if stats is None:
+        return valid_puzzle_found_callback(room)
+    with stats.timer("callback"):
+        valid_room_puzzle = valid_puzzle_found_callback(room)
+    if valid_room_puzzle:
+        stats.accept(len(room.paths))
+    else:
+        stats.reject("callback")
+    return valid_room_puzzle
+
+def iter_puzzles(num_rooms=None, max_paths=12, accept=None, min_difficulty=6, room_class=Room, rng=None, stats=None,
+                 pool_size=256, grader=None):
+    """
+    Generator version of run_lots: yields a PuzzleRecord for every accepted (room, final path), as they are found.
+    Only the room currently being run is kept in memory, and nothing is generated past the record being consumed,
+    so `break`, itertools.islice(iter_puzzles(...), n) etc. stop the search.
+
+    :param num_rooms: number of rooms to try; None to keep going forever.
+    :param accept: optional function which takes a Room (final path in paths[-1]) and returns True if it's a valid
+        final grid, like valid_puzzle_found_callback. It runs before the record is made, so it sees the whole room.
+    :param stats: optional lasercats_stats.LaserStats, aggregated over every room.
+    :param pool_size: rooms come from a RoomPool of this size, so accept mustn't hold on to them.
+    :param grader: optional lasercats_grader.Grader to measure min_difficulty with.
+    """
+    if accept is None:
+        accept = lambda room: True
+    pool = RoomPool(pool_size, rng=rng, room_class=room_class)
+    for room_index, room in enumerate(pool.iter_rooms(num_rooms)):
+        if stats is not None:
+            stats.rooms += 1
+        for _ in room.iter_final_paths(max_paths, min_heuristic_breakin_score=min_difficulty, stats=stats,
+                                       grader=grader):
+            if _check_room(accept, room, stats):
+                yield PuzzleRecord.from_room(room, room_index=room_index)
+
+def make_puzzle(min_difficulty=8, max_paths=12, ntries=1000, time_budget=None):
+    """
+    Returns the first valid puzzle found in up to ntries rooms, with its final path in paths[-1]; None if all fail.
+    :param time_budget: also give up after this many seconds.
+    """
+    deadline = None if time_budget is None else time.monotonic() + time_budget
     for _ in range(ntries):
-        r = make_room(max_paths, valid_puzzle_found_callback, min_difficulty=min_difficulty)
-        if done:
-            return r
-        else:
-            print("Puzzle construction failed; trying again.")
+        if deadline is not None and time.monotonic() > deadline:
+            print("Puzzle construction ran out of time.")
+            return None
+        room = Room()
+        for _ in room.iter_final_paths(max_paths, min_heuristic_breakin_score=min_difficulty):
+            return room
+        print("Puzzle construction failed; trying again.")
 
 if __name__ == "__main__":
     r = make_puzzle()
@@ -0,0 +1,238 @@
+import numpy as np
+
+from lasercats import MAX_BREAKIN_MARKS_PER_PATH, Path, Room, Terrain, directions, max_path_len, random_start_arrays
+
+# Direction indices follow lasercats.directions: 0=N, 1=E, 2=S, 3=W.
+DIR_STEPS = np.array([tuple(d) for d in directions], dtype=np.int64)
+
+# REFLECT[terrain, direction] is the direction after entering a cell of that terrain.
+REFLECT = np.array([
+    [0, 1, 2, 3],  # FLAT
+    [3, 2, 1, 0],  # UL: (dx, dy) -> (dy, dx)
+    [1, 0, 3, 2],  # UR: (dx, dy) -> (-dy, -dx)
+    [0, 1, 2, 3],  # HUMAN
+], dtype=np.int8)
+
+# FLIP[terrain] is the terrain after a beam has passed through the cell.
+FLIP = np.array([Terrain.FLAT, Terrain.UR, Terrain.UL, Terrain.HUMAN], dtype=np.int8)
+
+# Which of the first few path cells fillin_breakin_heuristic_grid marks, indexed by
+# [path length, relation of end side to launch side (0=same, 1=perpendicular, 2=opposite), lands_in_middle].
+BREAKIN_MARKS_LEN = 6
+BREAKIN_MARKS = np.zeros((BREAKIN_MARKS_LEN + 1, 3, 2, BREAKIN_MARKS_LEN), dtype=bool)
+BREAKIN_MARKS[2, :, :, :2] = True
+BREAKIN_MARKS[3, 1, :, :3] = True
+BREAKIN_MARKS[4, 0, 1, [0, 3]] = True
+BREAKIN_MARKS[4, 1, 1, 0] = True
+BREAKIN_MARKS[5, 0, :, [0, 4]] = True
+BREAKIN_MARKS[5, 2, :, :5] = True
+BREAKIN_MARKS[6, 2, 1, :3] = True
+BREAKIN_MARKS[6, 2, 0, 0] = True
+
+
+class BatchRooms():
+    """
+    N rooms of the same size, simulated in lockstep. Every room launches its k-th laser at the same time,
+    so one vectorized step advances the beam of every room at once.
+
+    The per-room state mirrors Room: `arrays`, `start_arrays`, `visited_locs` and `breakin_heuristic_grid`
+    are (N, size, size) tensors indexed [room, x, y]. Each launched laser appends one entry to `path_cells`,
+    `path_offsets`, `path_lengths`, `path_ends`, `path_end_dirs` and `path_all_visited`. Paths are ragged, so the
+    cells (x * size + y) of room r's i-th path are path_cells[i][path_offsets[i][r]:path_offsets[i][r + 1]], and a
+    laser costs memory in proportion to the cells its beams visit rather than N * max_path_len(size).
+    """
+    def __init__(self, n=None, size=5, mirror_prob=0.6, rng=None, start_arrays=None):
+        if start_arrays is None:
+            start_arrays = random_start_arrays(n, size, mirror_prob, rng, dtype=np.int8)
+        self.start_arrays = np.array(start_arrays, dtype=np.int8)
+        self.n, self.size = self.start_arrays.shape[:2]
+        self.arrays = np.array(self.start_arrays)
+        midpt = int((self.size - 1) / 2)
+        self.human_location = (midpt, midpt)
+
+        self.next_direction_dx = 0
+        self.max_path_len = max_path_len(self.size)
+        self.visited_locs = np.zeros((self.n, self.size, self.size), dtype=bool)
+        self.breakin_heuristic_grid = np.zeros((self.n, self.size, self.size), dtype=bool)
+        # Per-room totals of visited_locs and breakin_heuristic_grid, kept up to date as cells are set.
+        self.num_sites_visited = np.zeros(self.n, dtype=np.int64)
+        self.breakin_counts = np.zeros(self.n, dtype=np.int64)
+        self.midgame_counts = np.zeros(self.n, dtype=np.int64)
+
+        self.path_dirs = []
+        self.path_cells = []
+        self.path_offsets = []
+        self.path_lengths = []
+        self.path_ends = []
+        self.path_end_dirs = []
+        self.path_all_visited = []
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def num_paths(self):
+        return len(self.path_lengths)
+
+    @property
+    def all_sites_visited(self):
+        return self.num_sites_visited == self.size * self.size
+
+    @property
+    def heuristic_breakin_score(self):
+        return self.breakin_counts
+
+    @property
+    def heuristic_midgame_score(self):
+        return self.midgame_counts
+
+    def launch_laser(self, live=None):
+        """
+        Fires the next laser in every room (or only in rooms where `live` is True) and traces all beams to the wall.
+        Returns the index of the new path.
+        """
+        n, size = self.n, self.size
+        launch_dir = self.next_direction_dx
+        rooms = np.arange(n)
+        lengths = np.zeros(n, dtype=np.int64)
+        all_visited = np.ones(n, dtype=bool)
+        cursor = np.tile(np.array(self.human_location, dtype=np.int64), (n, 1))
+        direction = np.full(n, launch_dir, dtype=np.int8)
+        alive = np.ones(n, dtype=bool) if live is None else np.array(live, dtype=bool)
+        # Which rooms' beams entered which cell at each step, and how far along their paths they were.
+        step_rooms, step_positions, step_cells = [], [], []
+
+        while alive.any():
+            r = rooms[alive]
+            nxt = cursor[r] + DIR_STEPS[direction[r]]
+            cursor[r] = nxt
+            inside = ((nxt >= 0) & (nxt < size)).all(axis=1)
+            # Beams that stepped out have hit the wall.
+            alive[r[~inside]] = False
+            r, nxt = r[inside], nxt[inside]
+            x, y = nxt[:, 0], nxt[:, 1]
+
+            # Each room moves one cell per step, so r has no repeats.
+            seen = self.visited_locs[r, x, y]
+            all_visited[r] &= seen
+            self.num_sites_visited[r[~seen]] += 1
+            self.visited_locs[r, x, y] = True
+            terrain = self.arrays[r, x, y]
+            direction[r] = REFLECT[terrain, direction[r]]
+            self.arrays[r, x, y] = FLIP[terrain]
+            step_rooms.append(r)
+            step_positions.append(lengths[r])
+            step_cells.append(x * size + y)
+            lengths[r] += 1
+            alive[r[lengths[r] > self.max_path_len]] = False
+
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        cells = np.empty(offsets[-1], dtype=np.int32)
+        if step_rooms:
+            r = np.concatenate(step_rooms)
+            cells[offsets[r] + np.concatenate(step_positions)] = np.concatenate(step_cells)
+
+        self._fillin_breakin_heuristic_grid(launch_dir, cells, offsets, lengths, cursor)
+        self.midgame_counts += (5 < lengths) & (lengths < 12)
+
+        self.path_dirs.append(launch_dir)
+        self.path_cells.append(cells)
+        self.path_offsets.append(offsets)
+        self.path_lengths.append(lengths)
+        self.path_ends.append(cursor)
+        self.path_end_dirs.append(direction)
+        self.path_all_visited.append(all_visited)
+        self.next_direction_dx = (self.next_direction_dx + 1) % len(directions)
+        return self.num_paths - 1
+
+    def _fillin_breakin_heuristic_grid(self, launch_dir, cells, offsets, lengths, ends):
+        # Vectorized Path.fillin_breakin_heuristic_grid.
+        size = self.size
+        end_side = np.full(self.n, -1)
+        end_side[ends[:, 1] == size] = 2
+        end_side[ends[:, 0] == size] = 1
+        end_side[ends[:, 1] == -1] = 0
+        end_side[ends[:, 0] == -1] = 3
+        midpt = self.human_location[0]
+        lands_in_middle = (ends == midpt).any(axis=1)
+
+        relation = np.abs(launch_dir - end_side) % 2
+        relation[(launch_dir - end_side) % 4 == 2] = 2
+        marked = (end_side >= 0) & (lengths <= BREAKIN_MARKS_LEN)
+        marks = np.zeros((self.n, BREAKIN_MARKS_LEN), dtype=bool)
+        marks[marked] = BREAKIN_MARKS[lengths[marked], relation[marked], lands_in_middle[marked].astype(int)]
+        for k in range(BREAKIN_MARKS_LEN):
+            r = np.nonzero(marks[:, k])[0]
+            x, y = np.divmod(cells[offsets[r] + k], size)
+            self.breakin_counts[r[~self.breakin_heuristic_grid[r, x, y]]] += 1
+            self.breakin_heuristic_grid[r, x, y] = True
+
+    def launch_lotsa_lasers(self, max_lasers, valid_puzzle_found_callback=None,
+                            only_extract_after_all_visited=True, min_heuristic_breakin_score=6, min_heuristic_midgame_score=4,
+                            stop_after_complete=False, prune=True):
+        """
+        Batched Room.launch_lotsa_lasers, with the same arguments. Candidate rooms which pass every filter are
+        materialized with `to_room` and handed to valid_puzzle_found_callback one at a time.
+        """
+        if valid_puzzle_found_callback is None:
+            valid_puzzle_found_callback = lambda x: True
+        live = np.ones(self.n, dtype=bool)
+        for i in range(max_lasers):
+            # Rooms which can't reach the minimum scores in the lasers left stop firing, as in Room.iter_final_paths.
+            if prune:
+                lasers_left = max_lasers - i
+                live &= self.heuristic_breakin_score + MAX_BREAKIN_MARKS_PER_PATH * lasers_left >= min_heuristic_breakin_score
+                live &= self.heuristic_midgame_score + lasers_left >= min_heuristic_midgame_score
+                if not live.any():
+                    return
+            all_sites_visited_before_this_laser = self.all_sites_visited
+            idx = self.launch_laser(live)
+
+            candidates = live & self.path_all_visited[idx]
+            if only_extract_after_all_visited:
+                candidates &= all_sites_visited_before_this_laser
+            candidates &= self.heuristic_breakin_score >= min_heuristic_breakin_score
+            candidates &= self.heuristic_midgame_score >= min_heuristic_midgame_score
+
+            for r in np.nonzero(candidates)[0]:
+                valid_room_puzzle = valid_puzzle_found_callback(self.to_room(r))
+                if valid_room_puzzle and stop_after_complete:
+                    live[r] = False
+            if not live.any():
+                return
+
+    def to_room(self, r):
+        """
+        Builds an ordinary Room holding room r's current state and all of its paths so far.
+        """
+        room = Room(start_array=self.start_arrays[r].astype(np.int64))
+        room.array = self.arrays[r].astype(np.int64)
+        room.visited_locs = np.array(self.visited_locs[r])
+        room.breakin_heuristic_grid = np.array(self.breakin_heuristic_grid[r])
+        room.num_sites_visited = int(self.num_sites_visited[r])
+        room.heuristic_breakin_score = int(self.breakin_counts[r])
+        room.heuristic_midgame_score = int(self.midgame_counts[r])
+        room.next_direction_dx = self.next_direction_dx
+        for i in range(self.num_paths):
+            path = Path(room, directions[self.path_dirs[i]])
+            cells = self.path_cells[i][self.path_offsets[i][r]:self.path_offsets[i][r + 1]]
+            path.locations = [divmod(int(c), self.size) for c in cells]
+            path.cursor_location = tuple(int(c) for c in self.path_ends[i][r])
+            path.cursor_direction = directions[self.path_end_dirs[i][r]]
+            path.done = True
+            path.all_locations_already_visited = bool(self.path_all_visited[i][r])
+            room.paths.append(path)
+        return room
+
+
+def run_lots_batched(num_rooms, max_paths, valid_puzzle_found_callback, min_difficulty=6, batch_size=4096, rng=None):
+    """
+    Like lasercats.run_lots, but simulates batch_size rooms at a time.
+    valid_puzzle_found_callback has to include outputting the room somewhere, or the data will fall into a void.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    for start in range(0, num_rooms, batch_size):
+        rooms = BatchRooms(min(batch_size, num_rooms - start), rng=rng)
+        rooms.launch_lotsa_lasers(max_paths, valid_puzzle_found_callback, min_heuristic_breakin_score=min_difficulty)
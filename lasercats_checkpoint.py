@@ -0,0 +1,188 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from lasercats import PuzzleRecord, Room, RoomPool, _check_room
+from lasercats_stats import LaserStats
+
+# Long generation runs which survive being stopped. A ResumableRun works like iter_puzzles, but every so
+# often it saves a checkpoint: the RNG state, how many rooms it has run, how many records have gone into the store,
+# and (if given) the stats so far. Started again with the same checkpoint file, it carries on from there and gives
+# exactly the rooms and records an uninterrupted run would have.
+#
+# Rooms are drawn from a RoomPool a batch at a time, so checkpoints are only taken between batches, where the RNG
+# state says where the next batch comes from. Records found after the last checkpoint are written to the store
+# again on resume, so the store is first cut back to where it was at the checkpoint. The same goes for a
+# lasercats_dedup.FingerprintIndex passed as `seen`: it's cut back too, so a lasercats_dedup.SkipSeenPuzzles callback
+# doesn't turn the replayed puzzles away as already seen. Any other state a callback keeps isn't rolled back.
+
+
+class Checkpoint():
+    def __init__(self, filename):
+        self.filename = filename
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def load(self):
+        with open(self.filename) as f:
+            return json.load(f)
+
+    def save(self, state):
+        # Written to a temporary file and renamed over the old one, so a crash mid-save leaves the old checkpoint.
+        tmp = self.filename + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
+
+
+class Progress():
+    """
+    Prints rooms and accepted puzzles per second every `every` seconds, and tells a run when its time budget is up.
+    """
+    def __init__(self, num_rooms=None, time_budget=None, every=60, rooms_done=0, accepted=0):
+        self.num_rooms = num_rooms
+        self.time_budget = time_budget
+        self.every = every
+        self.start = time.monotonic()
+        self.last_report = self.start
+        self.start_rooms = rooms_done
+        self.start_accepted = accepted
+        self.rooms = rooms_done
+        self.accepted = accepted
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    @property
+    def out_of_time(self):
+        return self.time_budget is not None and self.elapsed >= self.time_budget
+
+    def update(self, rooms, accepted):
+        self.rooms = rooms
+        self.accepted = accepted
+        if self.every is not None and time.monotonic() - self.last_report >= self.every:
+            self.last_report = time.monotonic()
+            print(self.report())
+
+    def report(self):
+        elapsed = self.elapsed
+        rate = (self.rooms - self.start_rooms) / elapsed if elapsed else 0.0
+        accept_rate = (self.accepted - self.start_accepted) / elapsed if elapsed else 0.0
+        line = "{} rooms, {} accepted, {:.0f}s, {:.1f} rooms/s, {:.3f} accepted/s".format(
+            self.rooms, self.accepted, elapsed, rate, accept_rate)
+        if self.num_rooms is not None and rate:
+            line += ", about {:.0f}s to go".format((self.num_rooms - self.rooms) / rate)
+        return line
+
+
+class ResumableRun():
+    """
+    iter_puzzles, checkpointed to checkpoint_file. Iterating yields the same PuzzleRecords as
+    iter_puzzles(num_rooms, ..., rng=np.random.default_rng(seed)), resuming after the last checkpoint if the file
+    exists (seed is then ignored). The checkpoint is left in place when the run finishes, so running again yields
+    nothing more.
+    """
+    def __init__(self, checkpoint_file, num_rooms=None, max_paths=12, accept=None, min_difficulty=6, seed=None,
+                 store=None, room_class=Room, stats=None, pool_size=256, grader=None, checkpoint_every=60,
+                 time_budget=None, progress_every=60, seen=None):
+        """
+        :param store: optional lasercats_store.PuzzleStore which the caller appends the records to. It's flushed at
+            each checkpoint, and cut back to its size at the checkpoint here, so it's up to date once this returns.
+        :param stats: optional LaserStats, which the saved stats are merged into on resume.
+        :param seen: optional lasercats_dedup.FingerprintIndex which accept adds to, e.g. through SkipSeenPuzzles.
+            It's cut back to its size at the checkpoint here, like the store.
+        :param checkpoint_every: seconds between checkpoints.
+        :param time_budget: stop (after saving a checkpoint) once this many seconds of this run have passed.
+        :param progress_every: seconds between progress reports; None for none.
+        """
+        self.checkpoint = Checkpoint(checkpoint_file)
+        self.num_rooms = num_rooms
+        self.max_paths = max_paths
+        self.accept = accept if accept is not None else lambda room: True
+        self.min_difficulty = min_difficulty
+        self.store = store
+        self.seen = seen
+        self.room_class = room_class
+        self.stats = stats
+        self.pool_size = pool_size
+        self.grader = grader
+        self.checkpoint_every = checkpoint_every
+        self.time_budget = time_budget
+        self.progress_every = progress_every
+
+        self.rng = np.random.default_rng(seed)
+        self.room_index = 0
+        self.num_records = 0
+        if self.checkpoint.exists():
+            state = self.checkpoint.load()
+            self.rng.bit_generator.state = state["rng"]
+            self.room_index = state["room_index"]
+            self.num_records = state["num_records"]
+            if stats is not None and state["stats"] is not None:
+                stats.merge(LaserStats.from_dict(state["stats"]))
+            if store is not None and state["store_size"] is not None:
+                store.truncate(state["store_size"])
+            if seen is not None and state.get("seen_size") is not None:
+                seen.truncate(state["seen_size"])
+            print("Resuming at room {} with {} records.".format(self.room_index, self.num_records))
+
+    def __repr__(self):
+        return "<ResumableRun at room {} of {}, {} records>".format(self.room_index, self.num_rooms, self.num_records)
+
+    @property
+    def done(self):
+        return self.num_rooms is not None and self.room_index >= self.num_rooms
+
+    def snapshot(self):
+        """
+        Where the run is. Only a resumable place between batches.
+        """
+        return {
+            "rng": self.rng.bit_generator.state,
+            "room_index": self.room_index,
+            "num_records": self.num_records,
+            "store_size": None if self.store is None else len(self.store),
+            "seen_size": None if self.seen is None else len(self.seen),
+            "stats": None if self.stats is None else self.stats.to_dict(),
+        }
+
+    def save(self, state):
+        if self.store is not None:
+            self.store.flush()
+        self.checkpoint.save(state)
+
+    def __iter__(self):
+        progress = Progress(self.num_rooms, self.time_budget, self.progress_every, self.room_index, self.num_records)
+        last_save = time.monotonic()
+        pool = RoomPool(self.pool_size, rng=self.rng, room_class=self.room_class)
+        state = self.snapshot()
+        try:
+            while not self.done:
+                if time.monotonic() - last_save >= self.checkpoint_every:
+                    self.save(state)
+                    last_save = time.monotonic()
+                n = len(pool) if self.num_rooms is None else min(len(pool), self.num_rooms - self.room_index)
+                for room in pool.draw(n):
+                    if self.stats is not None:
+                        self.stats.rooms += 1
+                    for _ in room.iter_final_paths(self.max_paths, min_heuristic_breakin_score=self.min_difficulty,
+                                                   stats=self.stats, grader=self.grader):
+                        if _check_room(self.accept, room, self.stats):
+                            self.num_records += 1
+                            yield PuzzleRecord.from_room(room, room_index=self.room_index)
+                    self.room_index += 1
+                state = self.snapshot()
+                progress.update(self.room_index, self.num_records)
+                if progress.out_of_time:
+                    print("Out of time after room {}.".format(self.room_index))
+                    break
+        finally:
+            # Also on an exception or when the caller stops early. If that was mid-batch, the checkpoint is from
+            # before the batch, and the batch runs again on resume, finding the same records again.
+            self.save(state)
@@ -291,7 +291,8 @@ def direction_str(i):
     if i % 4 == 2: return "v"
     if i % 4 == 3: return "<"
 
-run(10000, 12)
+if __name__ == "__main__":
+    run(10000, 12)
 
 # g = Grid()
 # g.display()
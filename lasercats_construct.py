@@ -0,0 +1,193 @@
+import numpy as np
+
+from lasercats import (DEFAULT_LAUNCH_ORDER, MAX_BREAKIN_MARKS_PER_PATH, Room, Terrain, ending_side, is_midgame_length,
+                       random_terrain)
+from lasercats_batch import BREAKIN_MARKS, BREAKIN_MARKS_LEN
+from lasercats_solver import MIRROR_STATES, UNKNOWN, Solver, SolverBudgetExceeded
+
+# Builds rooms whose final path is picked in advance, instead of firing lasers into random rooms until one happens to
+# end the right way. The target is (number of paths, length of the last one, its exit cell).
+#
+# The search works back from the target in two stages. First a final path is drawn: a single beam, on an otherwise
+# empty board, which is launched from the human and has the target's length and exit. That fixes which of its cells
+# the final laser must find flat and which must be mirrors. Then the lasers before it are fired blind through the
+# Solver, which assigns each cell's starting terrain (in random order) the first time a beam reaches it, so every
+# assignment is consistent with the earlier paths by construction. Cells on the final path only get the terrains
+# allowed by the first stage, and the final laser may only cross cells an earlier laser has already reached. Cells the
+# first stage fixes are still only assigned when a beam first reaches them, so the search knows which were reached.
+# The heuristic scores only depend on each path once it's done, so they are kept as beams finish, and a branch is
+# dropped as soon as the lasers left can't bring them up to min_difficulty / min_heuristic_midgame_score.
+#
+# Searches which take more than max_nodes steps are restarted with a new final path, and cells no beam touches
+# are filled in with random_terrain. Every room is then re-fired with the ordinary simulation and checked against
+# launch_lotsa_lasers' filters, so whatever comes out is exactly what make_room could have found.
+#
+# Most searches still run out of nodes, and long final paths rarely construct at all. Measured on the LIVIDFELID
+# slots (rage_of_the_quebecats), final laser 9 to 12, 160 searches per slot, share of searches giving a room:
+#     length  4 (D)   6%   (slot 4's exit can't be reached in 4 cells by lasers 11 and 12)
+#     length  5 (E)   8%
+#     length  6 (F)   4%
+#     length  9 (I)   3%
+#     length 12 (L)   0.3%
+#     length 22 (V)   0%   (1 in 60 with max_nodes=20000)
+# That is about 6.6 rooms per CPU-second over all slots at max_nodes=3000, against 3.6 at 20000 and 2 at 100000: a
+# bigger budget finishes more searches but not enough to pay for them, so 3000 stays the default.
+
+
+def breakin_marks(launch_dir, length, end_location, size=5):
+    """
+    Which positions along a path Path.fillin_breakin_heuristic_grid marks, given how it was launched and ended.
+    """
+    side = ending_side(end_location, size)
+    if side is None or length > BREAKIN_MARKS_LEN:
+        return ()
+    if (launch_dir - side) % 4 == 2:
+        relation = 2
+    else:
+        relation = abs(launch_dir - side) % 2
+    midpt = int((size - 1) / 2)
+    lands_in_middle = end_location[0] == midpt or end_location[1] == midpt
+    return tuple(np.nonzero(BREAKIN_MARKS[length, relation, int(lands_in_middle)])[0])
+
+
+class RandomOrderSolver(Solver):
+    """
+    Solver which tries the terrains of each new cell in random order, so its first solution is a random one.
+    """
+    def __init__(self, clues, size=5, domains=None, max_nodes=None, rng=None):
+        super().__init__(clues, size=size, domains=domains, max_nodes=max_nodes)
+        self.rng = np.random if rng is None else rng
+
+    def _values(self, k, cell):
+        values = list(self.domains[cell])
+        self.rng.shuffle(values)
+        return values
+
+
+def final_path_domains(launch_dir, length, end_location, size=5, rng=None, max_nodes=None):
+    """
+    Draws a random path launched in launch_dir with the given length and exit, and returns the per-cell domains
+    (as for Solver) that let the final laser take it: FLAT for cells it goes straight through, UL or UR for cells
+    it turns in, anything for the rest. None if there is no such path.
+    """
+    solver = RandomOrderSolver([(launch_dir, length, tuple(end_location))], size, max_nodes=max_nodes, rng=rng)
+    for partial_start_array, _ in solver.solutions():
+        domains = []
+        for terrain in partial_start_array.flatten():
+            if terrain == UNKNOWN:
+                domains.append(MIRROR_STATES)
+            elif terrain == Terrain.FLAT or terrain == Terrain.HUMAN:
+                domains.append((terrain,))
+            else:
+                domains.append((Terrain.UL, Terrain.UR))
+        return domains
+
+
+class ConstructiveSolver(RandomOrderSolver):
+    record_path_cells = True
+
+    def __init__(self, num_paths, length, end_location, size=5, min_difficulty=6, min_heuristic_midgame_score=4,
+                 only_extract_after_all_visited=True, domains=None, rng=None, max_nodes=None):
+        """
+        :param num_paths: which laser (counting from 1) is the final one.
+        :param length: how many cells the final path visits.
+        :param end_location: where the final path exits, e.g. (x, -1) for the north wall.
+        :param domains: per-cell starting terrains to allow, e.g. from final_path_domains.
+        """
+        launch_dir = DEFAULT_LAUNCH_ORDER[(num_paths - 1) % len(DEFAULT_LAUNCH_ORDER)]
+        clues = [None] * (num_paths - 1) + [(launch_dir, length, tuple(end_location))]
+        super().__init__(clues, size=size, domains=domains, max_nodes=max_nodes, rng=rng)
+        # Solver assigns cells with only one allowed terrain up front; here they wait for a beam like the rest.
+        for cell in range(size * size):
+            if cell != self.center:
+                self.start[cell] = self.current[cell] = UNKNOWN
+        self.visited = set() # cells the lasers before the final one visit, once they have all finished
+        self.min_difficulty = min_difficulty
+        self.min_heuristic_midgame_score = min_heuristic_midgame_score
+        self.only_extract_after_all_visited = only_extract_after_all_visited
+        self.breakin_cells = set()
+        self.midgame_score = 0
+
+    def _values(self, k, cell):
+        if k == len(self.clues) - 1 and cell not in self.visited:
+            # The final path can't enter a cell no earlier path has visited.
+            return ()
+        return super()._values(k, cell)
+
+    def _finish_beam(self, k, length, end):
+        final = len(self.clues) - 1
+        if k == final - 1:
+            self.visited = set().union(*self.path_cells[:final])
+            if self.only_extract_after_all_visited and len(self.visited) < self.size * self.size:
+                return
+        marked = {self.path_cells[k][i] for i in breakin_marks(self.launch_dirs[k], length, end, self.size)}
+        marked -= self.breakin_cells
+        midgame = is_midgame_length(length)
+        # Most a path can still add: MAX_BREAKIN_MARKS_PER_PATH marks and 1 to the midgame score.
+        lasers_left = final - k
+        if len(self.breakin_cells) + len(marked) + MAX_BREAKIN_MARKS_PER_PATH * lasers_left < self.min_difficulty:
+            return
+        if self.midgame_score + midgame + lasers_left < self.min_heuristic_midgame_score:
+            return
+        self.breakin_cells |= marked
+        self.midgame_score += midgame
+        try:
+            yield from super()._finish_beam(k, length, end)
+        finally:
+            self.breakin_cells -= marked
+            self.midgame_score -= midgame
+
+
+def complete_layout(partial_start_array, mirror_prob=0.6, rng=None):
+    """
+    Fills the UNKNOWN cells of a partial start array with random terrain.
+    """
+    partial_start_array = np.asarray(partial_start_array)
+    fill = random_terrain(partial_start_array.shape, mirror_prob, rng)
+    return np.where(partial_start_array == UNKNOWN, fill, partial_start_array)
+
+
+def construct_rooms(num_paths, length, end_location, min_difficulty=6, min_heuristic_midgame_score=4,
+                    only_extract_after_all_visited=True, size=5, mirror_prob=0.6, room_class=Room, rng=None,
+                    max_nodes=3000, max_restarts=None, rooms_per_search=1):
+    """
+    Yields rooms whose paths[-1] is laser num_paths, has the given length and exits at end_location, and which pass
+    the same filters as in launch_lotsa_lasers. Runs forever unless max_restarts is given, even when every search
+    runs out of nodes, so for long final paths (see above) give max_restarts.
+    :param rooms_per_search: how many rooms to take from one search before restarting. Rooms from the same search
+        mostly differ in a cell or two, so more than 1 trades variety for speed.
+    """
+    launch_dir = DEFAULT_LAUNCH_ORDER[(num_paths - 1) % len(DEFAULT_LAUNCH_ORDER)]
+    restarts = 0
+    while max_restarts is None or restarts < max_restarts:
+        restarts += 1
+        found = 0
+        try:
+            domains = final_path_domains(launch_dir, length, end_location, size, rng, max_nodes)
+            if domains is None:
+                return # No path can have this length and exit.
+            solver = ConstructiveSolver(num_paths, length, end_location, size, min_difficulty,
+                                        min_heuristic_midgame_score, only_extract_after_all_visited, domains, rng,
+                                        max_nodes)
+            for partial_start_array, _ in solver.solutions():
+                room = room_class(start_array=complete_layout(partial_start_array, mirror_prob, rng))
+                for _ in room.iter_final_paths(num_paths, only_extract_after_all_visited, min_difficulty,
+                                               min_heuristic_midgame_score):
+                    if len(room.paths) == num_paths:
+                        yield room
+                        found += 1
+                if found >= rooms_per_search:
+                    break
+        except SolverBudgetExceeded:
+            pass
+
+
+def construct_room(num_paths, length, end_location, valid_puzzle_found_callback=None, max_restarts=1000, **kwargs):
+    """
+    Like make_room, but for one target final path: returns the first constructed room valid_puzzle_found_callback
+    accepts, or None if there is none within max_restarts searches.
+    Other keyword arguments are passed to construct_rooms.
+    """
+    for room in construct_rooms(num_paths, length, end_location, max_restarts=max_restarts, **kwargs):
+        if valid_puzzle_found_callback is None or valid_puzzle_found_callback(room):
+            return room
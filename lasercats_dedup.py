@@ -0,0 +1,81 @@
+import os
+
+
+class FingerprintIndex():
+    """
+    The set of puzzle fingerprints (see lasercats.fingerprint) seen so far, kept in an append-only text file with one
+    fingerprint per line, so that many generation runs can share it and skip puzzles found before.
+    """
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.fingerprints = set()
+        self.order = [] # the same fingerprints, in the order they were added
+        if filename is not None and os.path.exists(filename):
+            for fp in self._read(filename):
+                if fp not in self.fingerprints:
+                    self.fingerprints.add(fp)
+                    self.order.append(fp)
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self.fingerprints
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    @staticmethod
+    def _read(filename):
+        with open(filename) as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def add(self, fingerprint):
+        """
+        Returns True if the fingerprint is new (and records it), False if it was already known.
+        """
+        if fingerprint in self.fingerprints:
+            return False
+        self.fingerprints.add(fingerprint)
+        self.order.append(fingerprint)
+        if self.filename is not None:
+            with open(self.filename, 'a') as f:
+                f.write(fingerprint + "\n")
+        return True
+
+    def truncate(self, n):
+        """
+        Forgets every fingerprint after the first n added, and rewrites the file to match. For rolling back to a
+        checkpoint (see lasercats_checkpoint.ResumableRun); nothing else should be appending to the file meanwhile.
+        """
+        if n >= len(self.order):
+            return
+        self.fingerprints.difference_update(self.order[n:])
+        del self.order[n:]
+        if self.filename is not None:
+            tmp = self.filename + ".tmp"
+            with open(tmp, 'w') as f:
+                f.writelines(fp + "\n" for fp in self.order)
+            os.replace(tmp, self.filename)
+
+    def merge(self, filename):
+        """
+        Adds every fingerprint from another index file. Returns how many were new.
+        """
+        return sum(self.add(fp) for fp in self._read(filename))
+
+
+class SkipSeenPuzzles():
+    """
+    Wraps a valid_puzzle_found_callback so that puzzles already in the index are rejected without calling it.
+    Puzzles the callback accepts are added to the index.
+    """
+    def __init__(self, valid_puzzle_found_callback, index):
+        self.valid_puzzle_found_callback = valid_puzzle_found_callback
+        self.index = index
+
+    def __call__(self, room):
+        fp = room.fingerprint(len(room.paths))
+        if fp in self.index:
+            return False
+        valid_room_puzzle = self.valid_puzzle_found_callback(room)
+        if valid_room_puzzle:
+            self.index.add(fp)
+        return valid_room_puzzle
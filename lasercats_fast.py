@@ -0,0 +1,174 @@
+import numpy as np
+
+from lasercats import (DEFAULT_LAUNCH_ORDER, Path, Room, Terrain, dir_array_to_idx, directions, is_midgame_length,
+                       pack_layout, unpack_layout)
+
+# A faster backend for Room/Path. The board is one Python int with 2 bits per cell (cell index x * size + y),
+# visited cells are a bitmask, and the beam is a (cell, direction index) pair. Each step is a couple of
+# table lookups instead of NumPy scalar indexing.
+#
+# Traces aren't memoized. An LRU cache keyed on the cells a trace reads was tried, and it made annealing (1.58s ->
+# 1.99s, at a 12% hit rate) and run_forking (0.59s -> 1.00s) slower: building and probing the key costs more than
+# the few int operations per cell a hit saves. The Solver doesn't gain from it either, since it branches on each
+# unknown cell as the beam reaches it.
+
+# REFLECT[terrain * 4 + direction] is the direction after entering a cell of that terrain.
+REFLECT = (
+    0, 1, 2, 3,  # FLAT
+    3, 2, 1, 0,  # UL
+    1, 0, 3, 2,  # UR
+    0, 1, 2, 3,  # HUMAN
+)
+CELL_BITS = 2
+CELL_MASK = 3
+
+_TABLES = {}
+
+
+def transition_tables(size):
+    """
+    Returns (next_cell, cell_xy, exit_xy) for a room of the given size:
+        next_cell[cell * 4 + direction] is the cell the beam moves into, or -1 if it hits the wall.
+        cell_xy[cell] is the (x, y) location of a cell.
+        exit_xy[cell * 4 + direction] is the location just outside the wall the beam hits.
+    """
+    if size not in _TABLES:
+        next_cell, exit_xy = [], []
+        cell_xy = [(x, y) for x in range(size) for y in range(size)]
+        for x, y in cell_xy:
+            for d in directions:
+                nx, ny = x + int(d[0]), y + int(d[1])
+                inside = 0 <= nx < size and 0 <= ny < size
+                next_cell.append(nx * size + ny if inside else -1)
+                exit_xy.append(None if inside else (nx, ny))
+        _TABLES[size] = (tuple(next_cell), tuple(cell_xy), tuple(exit_xy))
+    return _TABLES[size]
+
+
+def pack_array(array):
+    return int.from_bytes(pack_layout(array), 'little')
+
+
+def unpack_array(board, size):
+    return unpack_layout(board.to_bytes((size * size + 3) // 4, 'little'), size)
+
+
+class FastRoom(Room):
+    """
+    Room with a bit-packed board. Behaves exactly like Room (same RNG draws, same paths, same callbacks), but
+    `array` and `visited_locs` are decoded on demand, so they are read-only copies; change the board through
+    flip_mirror instead.
+    """
+    def __init__(self, size=5, mirror_prob=0.6, start_array=None, rng=None, launch_order=DEFAULT_LAUNCH_ORDER):
+        super().__init__(size=size, mirror_prob=mirror_prob, start_array=start_array, rng=rng,
+                         launch_order=launch_order)
+        self.tables = transition_tables(self.size)
+
+    @property
+    def array(self):
+        return unpack_array(self.board, self.size)
+
+    @array.setter
+    def array(self, array):
+        self.board = pack_array(array)
+
+    @property
+    def visited_locs(self):
+        size = self.size
+        return np.array([bool(self.visited >> cell & 1) for cell in range(size * size)]).reshape(size, size)
+
+    @visited_locs.setter
+    def visited_locs(self, visited_locs):
+        self.visited = 0
+        for cell, v in enumerate(np.asarray(visited_locs).ravel()):
+            if v:
+                self.visited |= 1 << cell
+        self.num_sites_visited = bin(self.visited).count("1")
+
+    def _reset_board(self):
+        self.board = pack_array(self.start_array)
+        self.visited = 0
+
+    def save_state(self):
+        return self.board, self.visited, np.array(self.breakin_heuristic_grid), len(self.paths), self.next_direction_dx
+
+    def restore_state(self, state):
+        self.board, self.visited, breakin_heuristic_grid, num_paths, self.next_direction_dx = state
+        self.breakin_heuristic_grid = np.array(breakin_heuristic_grid)
+        del self.paths[num_paths:]
+        self._recount()
+
+    def _recount(self):
+        self.num_sites_visited = bin(self.visited).count("1")
+        self.heuristic_breakin_score = int(np.sum(self.breakin_heuristic_grid))
+        self.heuristic_midgame_score = sum(1 for p in self.paths if is_midgame_length(len(p)))
+
+    def _cell_shift(self, location):
+        return CELL_BITS * (location[0] * self.size + location[1])
+
+    def patch_state(self, state, location, terrain):
+        shift = self._cell_shift(location)
+        return (state[0] & ~(CELL_MASK << shift) | (terrain << shift),) + state[1:]
+
+    def set_unvisited_cell(self, location, terrain):
+        assert not self.visited >> (location[0] * self.size + location[1]) & 1
+        shift = self._cell_shift(location)
+        self.start_array[location] = terrain
+        self.board = self.board & ~(CELL_MASK << shift) | (terrain << shift)
+
+    def flip_mirror(self, location):
+        shift = CELL_BITS * (location[0] * self.size + location[1])
+        assert (self.board >> shift) & CELL_MASK in (Terrain.UL, Terrain.UR)
+        self.board ^= CELL_MASK << shift
+
+    def _new_path(self, direction):
+        return FastPath(self, direction, launch_dir_idx=self.launch_order[self.next_direction_dx])
+
+
+class FastPath(Path):
+    def __init__(self, room, start_direction, launch_dir_idx=None):
+        # Skips the linear scan in dir_array_to_idx when the caller already knows the direction index.
+        self.room = room
+        self.locations = []
+        self.launch_dir_idx = dir_array_to_idx(start_direction) if launch_dir_idx is None else launch_dir_idx
+        self.cursor_direction = start_direction
+        self.cursor_location = room.human_location
+        self.done = False
+        self.all_locations_already_visited = True
+
+    def run(self):
+        room = self.room
+        next_cell, cell_xy, exit_xy = room.tables
+        board, visited = room.board, room.visited
+        d = self.launch_dir_idx
+        cell = room.human_location[0] * room.size + room.human_location[1]
+        max_len = room.max_path_len
+        all_visited = True
+        newly_visited = 0
+        cells = []
+        while True:
+            state = cell * 4 + d
+            cell = next_cell[state]
+            if cell < 0:
+                self.cursor_location = exit_xy[state]
+                break
+            bit = 1 << cell
+            if not visited & bit:
+                all_visited = False
+                visited |= bit
+                newly_visited += 1
+            shift = CELL_BITS * cell
+            terrain = (board >> shift) & CELL_MASK
+            d = REFLECT[terrain * 4 + d]
+            if terrain == Terrain.UL or terrain == Terrain.UR:
+                board ^= CELL_MASK << shift
+            cells.append(cell)
+            if len(cells) > max_len:
+                self.cursor_location = cell_xy[cell]
+                break
+        room.board, room.visited = board, visited
+        room.num_sites_visited += newly_visited
+        self.locations = [cell_xy[c] for c in cells]
+        self.cursor_direction = directions[d]
+        self.all_locations_already_visited = all_visited
+        self.done = True
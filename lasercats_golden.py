@@ -0,0 +1,317 @@
+import json
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import lasercats
+import lasercats_code_old
+from lasercats_batch import BatchRooms
+from lasercats_fast import FastRoom
+
+# A recorded corpus of reference traces, for checking that a faster engine fires lasers exactly like lasercats.Room.
+# For every room it keeps the starting layout and, for each laser: the cells the beam visited in order, its exit
+# cell, whether every cell had been visited before, and the breakin heuristic grid after it. Replaying fires the
+# same layouts through another engine and reports the first place the traces part ways.
+#
+# The corpus is an .npz file. Paths are ragged, so their cells (x * size + y) are concatenated in room-then-laser
+# order into `cells`, and path p's cells are cells[offsets[p]:offsets[p + 1]], with p = room * lasers + laser.
+# Replays go chunk by chunk on a process pool, and compare whole chunks with numpy, so the cost is mostly the
+# engine's own.
+
+LASERS_PER_ROOM = 12
+
+# A trace is a dict of arrays over a chunk of m rooms and L lasers:
+#   lengths      (m, L) path lengths
+#   ends         (m, L, 2) exit cells (the last cell, for a truncated path)
+#   cells        (m, L, W) cells visited, padded with -1 to the longest path in the chunk
+#   all_visited  (m, L) Path.all_locations_already_visited
+#   breakin      (m, L, size * size) breakin_heuristic_grid after each laser, flattened
+TRACE_FIELDS = ("cells", "ends", "all_visited", "breakin") # in the order a divergence is looked for
+
+# Where an engine first disagrees with the corpus. For "cells", step is the index in the path of the first differing
+# cell, and expected / got are the cells there; for the other fields, step is None.
+Divergence = namedtuple("Divergence", ["room", "laser", "step", "field", "expected", "got"])
+
+
+def legacy_grid(start_array):
+    """
+    A lasercats_code_old.Grid with the given starting layout (Grid itself can only draw a random one).
+    """
+    grid = lasercats_code_old.Grid.__new__(lasercats_code_old.Grid)
+    grid.size = len(start_array)
+    grid.array = np.array(start_array)
+    grid.start_array = np.array(start_array)
+    midpt = int((grid.size - 1) / 2)
+    grid.human_location = (midpt, midpt)
+    grid.paths = []
+    grid.next_direction_dx = 0
+    grid.visited_locs = np.zeros(shape=(grid.size, grid.size), dtype=bool)
+    grid.possible_extractions = []
+    grid.breakin_heuristic_grid = np.zeros(shape=(grid.size, grid.size), dtype=bool)
+    return grid
+
+
+def _pad_cells(paths, size):
+    width = max((len(p) for p in paths), default=0)
+    cells = np.full((len(paths), width), -1, dtype=np.int16)
+    for i, locations in enumerate(paths):
+        if locations:
+            xy = np.array(locations)
+            cells[i, :len(locations)] = xy[:, 0] * size + xy[:, 1]
+    return cells
+
+
+def _trace_rooms(make_room, start_arrays, num_lasers):
+    # Trace for any engine with Room's per-room API.
+    m, size = len(start_arrays), start_arrays.shape[1]
+    lengths = np.zeros((m, num_lasers), dtype=np.int16)
+    ends = np.zeros((m, num_lasers, 2), dtype=np.int8)
+    all_visited = np.zeros((m, num_lasers), dtype=bool)
+    breakin = np.zeros((m, num_lasers, size * size), dtype=bool)
+    paths = []
+    for r, start_array in enumerate(start_arrays):
+        room = make_room(start_array)
+        for k in range(num_lasers):
+            path = room.launch_laser()
+            paths.append(path.locations)
+            lengths[r, k] = len(path)
+            ends[r, k] = path.cursor_location
+            all_visited[r, k] = path.all_locations_already_visited
+            breakin[r, k] = room.breakin_heuristic_grid.ravel()
+    cells = _pad_cells(paths, size).reshape(m, num_lasers, -1)
+    return {"lengths": lengths, "ends": ends, "cells": cells, "all_visited": all_visited, "breakin": breakin}
+
+
+def _trace_batch(start_arrays, num_lasers):
+    rooms = BatchRooms(start_arrays=start_arrays)
+    breakin = []
+    for _ in range(num_lasers):
+        rooms.launch_laser()
+        breakin.append(rooms.breakin_heuristic_grid.reshape(len(rooms), -1).copy())
+    m = len(rooms)
+    width = max((int(lengths.max(initial=0)) for lengths in rooms.path_lengths), default=0)
+    cells = np.full((m, num_lasers, width), -1, dtype=np.int16)
+    for k in range(num_lasers):
+        r = np.repeat(np.arange(m), rooms.path_lengths[k])
+        cells[r, k, np.arange(len(r)) - rooms.path_offsets[k][r]] = rooms.path_cells[k]
+    return {
+        "lengths": np.stack(rooms.path_lengths, axis=1),
+        "ends": np.stack(rooms.path_ends, axis=1),
+        "cells": cells,
+        "all_visited": np.stack(rooms.path_all_visited, axis=1),
+        "breakin": np.stack(breakin, axis=1),
+    }
+
+
+class RoomEngine():
+    """
+    An engine for replay made from any class with Room's API, e.g. RoomEngine(FastRoom). Picklable if the class is.
+    """
+    def __init__(self, room_class):
+        self.room_class = room_class
+
+    def __repr__(self):
+        return "RoomEngine({})".format(self.room_class.__name__)
+
+    def __call__(self, start_arrays, num_lasers):
+        return _trace_rooms(lambda a: self.room_class(start_array=a), start_arrays, num_lasers)
+
+
+# An engine is a function of (start arrays, number of lasers) which returns their trace.
+ENGINES = {
+    "room": RoomEngine(lasercats.Room),
+    "fast_room": RoomEngine(FastRoom),
+    "batch": _trace_batch,
+    # Cuts paths at 50 cells rather than max_path_len, so it's expected to diverge on long paths.
+    "legacy_grid": lambda start_arrays, num_lasers: _trace_rooms(legacy_grid, start_arrays, num_lasers),
+}
+
+
+def _trace_chunk(engine, start_arrays, num_lasers):
+    if isinstance(engine, str):
+        engine = ENGINES[engine]
+    return engine(start_arrays, num_lasers)
+
+
+def _map_chunks(engine, chunks, num_lasers, processes):
+    # Traces each chunk of start arrays with the engine, in order; on a process pool unless processes == 1.
+    if processes == 1:
+        for start_arrays in chunks:
+            yield _trace_chunk(engine, start_arrays, num_lasers)
+        return
+    chunks = iter(chunks)
+    executor = ProcessPoolExecutor(max_workers=processes)
+    pending = []
+    try:
+        while True:
+            # Keep a couple of chunks per worker queued, but no more, so that stopping early is cheap and finished
+            # traces don't pile up.
+            for start_arrays in chunks:
+                pending.append(executor.submit(_trace_chunk, engine, start_arrays, num_lasers))
+                if len(pending) >= 2 * processes:
+                    break
+            if not pending:
+                break
+            yield pending.pop(0).result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def record_corpus(filename, num_rooms, num_lasers=LASERS_PER_ROOM, size=5, mirror_prob=0.6, seed=0,
+                  chunk_size=10000, processes=None):
+    """
+    Fires num_lasers lasers in num_rooms random rooms with the reference lasercats.Room, and saves the traces.
+    The layouts are random_start_arrays(num_rooms, size, mirror_prob, np.random.default_rng(seed)).
+    """
+    start_arrays = lasercats.random_start_arrays(num_rooms, size, mirror_prob, np.random.default_rng(seed),
+                                                 dtype=np.int8)
+    chunks = [start_arrays[i:i + chunk_size] for i in range(0, num_rooms, chunk_size)]
+    lengths, ends, all_visited, breakin, cells = [], [], [], [], []
+    for trace in _map_chunks("room", chunks, num_lasers, processes or os.cpu_count()):
+        lengths.append(trace["lengths"])
+        ends.append(trace["ends"])
+        all_visited.append(trace["all_visited"])
+        breakin.append(np.packbits(trace["breakin"], axis=-1))
+        padded = trace["cells"].reshape(-1, trace["cells"].shape[-1])
+        cells.append(padded[padded >= 0]) # row by row, so room-then-laser order
+    lengths = np.concatenate(lengths)
+    meta = {"size": size, "mirror_prob": mirror_prob, "seed": seed, "num_lasers": num_lasers,
+            "max_path_len": lasercats.max_path_len(size)}
+    np.savez_compressed(
+        filename, meta=np.array(json.dumps(meta)), start_arrays=start_arrays, lengths=lengths,
+        ends=np.concatenate(ends), all_visited=np.concatenate(all_visited), breakin=np.concatenate(breakin),
+        offsets=np.concatenate([[0], np.cumsum(lengths.ravel(), dtype=np.int64)]),
+        cells=np.concatenate(cells).astype(np.uint8 if size * size <= 256 else np.uint16),
+    )
+
+
+class GoldenCorpus():
+    def __init__(self, filename):
+        data = np.load(filename)
+        meta = json.loads(str(data["meta"]))
+        self.size = meta["size"]
+        self.mirror_prob = meta["mirror_prob"]
+        self.seed = meta["seed"]
+        self.num_lasers = meta["num_lasers"]
+        self.max_path_len = meta["max_path_len"]
+        self.start_arrays = data["start_arrays"]
+        self.lengths = data["lengths"]
+        self.ends = data["ends"]
+        self.all_visited = data["all_visited"]
+        self.breakin = data["breakin"]
+        self.offsets = data["offsets"]
+        self.cells = data["cells"]
+
+    def __len__(self):
+        return len(self.start_arrays)
+
+    def __repr__(self):
+        return "<GoldenCorpus of {} {}x{} rooms, {} lasers each>".format(len(self), self.size, self.size,
+                                                                         self.num_lasers)
+
+    def trace(self, start, stop):
+        """
+        The recorded trace of rooms start to stop - 1, in the same form as an engine's.
+        """
+        lengths = self.lengths[start:stop]
+        first, last = start * self.num_lasers, stop * self.num_lasers
+        flat_lengths = lengths.ravel().astype(np.int64)
+        cells = np.full((len(flat_lengths), max(int(flat_lengths.max(initial=0)), 1)), -1, dtype=np.int16)
+        rows = np.repeat(np.arange(len(flat_lengths)), flat_lengths)
+        cols = np.arange(len(rows)) - np.repeat(self.offsets[first:last] - self.offsets[first], flat_lengths)
+        cells[rows, cols] = self.cells[self.offsets[first]:self.offsets[last]]
+        breakin = np.unpackbits(self.breakin[start:stop], axis=-1, count=self.size * self.size).astype(bool)
+        return {"lengths": lengths, "ends": self.ends[start:stop], "cells": cells.reshape(stop - start, self.num_lasers, -1),
+                "all_visited": self.all_visited[start:stop], "breakin": breakin}
+
+
+def _mismatches(expected, got):
+    # (m, L) array of the first field (index into TRACE_FIELDS) which differs for each path, or -1, and the step.
+    m, num_lasers = expected["lengths"].shape
+    width = max(expected["cells"].shape[-1], got["cells"].shape[-1])
+    pad = lambda cells: np.pad(cells, ((0, 0), (0, 0), (0, width - cells.shape[-1])), constant_values=-1)
+    cells_differ = pad(expected["cells"]) != pad(got["cells"])
+    steps = np.argmax(cells_differ, axis=-1)
+    differs = [
+        cells_differ.any(axis=-1) | (expected["lengths"] != got["lengths"]),
+        (expected["ends"] != got["ends"]).any(axis=-1),
+        expected["all_visited"] != got["all_visited"],
+        (expected["breakin"] != got["breakin"]).any(axis=-1),
+    ]
+    field = np.full((m, num_lasers), -1)
+    for i in reversed(range(len(TRACE_FIELDS))):
+        field[differs[i]] = i
+    return field, steps
+
+
+def _divergence(expected, got, r, k, field, step, first_room, size):
+    name = TRACE_FIELDS[field]
+    if name == "cells":
+        # The cell each engine's beam visited at that step, as (x, y), or None if its path had already ended.
+        cell = lambda cells: divmod(int(cells[step]), size) if step < len(cells) and cells[step] >= 0 else None
+        return Divergence(first_room + r, k, int(step), name, cell(expected["cells"][r, k]), cell(got["cells"][r, k]))
+    if name == "breakin":
+        # The marked cells, as (x, y).
+        marked = lambda grid: [divmod(int(c), size) for c in np.nonzero(grid)[0]]
+        return Divergence(first_room + r, k, None, name, marked(expected[name][r, k]), marked(got[name][r, k]))
+    return Divergence(first_room + r, k, None, name, expected[name][r, k].tolist(), got[name][r, k].tolist())
+
+
+class ReplayReport():
+    def __init__(self, engine):
+        self.engine = engine
+        self.rooms = 0
+        self.divergent_rooms = 0
+        self.first = None # the first Divergence, by room then laser
+
+    def __repr__(self):
+        return "<ReplayReport {}: {} of {} rooms diverge{}>".format(
+            self.engine, self.divergent_rooms, self.rooms, "" if self.first is None else ", first " + str(self.first))
+
+    @property
+    def ok(self):
+        return self.divergent_rooms == 0
+
+
+def replay(corpus, engine, chunk_size=10000, processes=None, max_rooms=None, stop_at_first=False):
+    """
+    Fires every room of the corpus through the engine and compares its traces against the recorded ones.
+
+    :param corpus: a GoldenCorpus, or the filename of one.
+    :param engine: a name in ENGINES, or any engine: a picklable (module-level) function of (start arrays, number
+        of lasers) returning their trace, e.g. a RoomEngine.
+    :param stop_at_first: stop after the chunk with the first divergence, instead of counting every divergent room.
+    """
+    if not isinstance(corpus, GoldenCorpus):
+        corpus = GoldenCorpus(corpus)
+    num_rooms = len(corpus) if max_rooms is None else min(max_rooms, len(corpus))
+    starts = range(0, num_rooms, chunk_size)
+    chunks = (corpus.start_arrays[start:start + chunk_size][:num_rooms - start] for start in starts)
+    report = ReplayReport(engine if isinstance(engine, str) else repr(engine))
+    for start, got in zip(starts, _map_chunks(engine, chunks, corpus.num_lasers, processes or os.cpu_count())):
+        expected = corpus.trace(start, start + len(got["lengths"]))
+        field, steps = _mismatches(expected, got)
+        divergent = (field >= 0).any(axis=1)
+        report.rooms += len(divergent)
+        report.divergent_rooms += int(divergent.sum())
+        if report.first is None and divergent.any():
+            r = int(np.argmax(divergent))
+            k = int(np.argmax(field[r] >= 0))
+            report.first = _divergence(expected, got, r, k, field[r, k], steps[r, k], start,
+                                         corpus.size)
+            if stop_at_first:
+                break
+    return report
+
+
+if __name__ == "__main__":
+    # python lasercats_golden.py record CORPUS.npz NUM_ROOMS
+    # python lasercats_golden.py replay CORPUS.npz [ENGINE ...]
+    if sys.argv[1] == "record":
+        record_corpus(sys.argv[2], int(sys.argv[3]))
+    else:
+        for engine in sys.argv[3:] or sorted(ENGINES):
+            print(replay(sys.argv[2], engine))
@@ -0,0 +1,167 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from lasercats import DEFAULT_LAUNCH_ORDER, Terrain
+from lasercats_construct import complete_layout
+from lasercats_solver import MIRROR_STATES, UNKNOWN, Solver
+
+# Precomputed answers for the opening of a room. The first laser or two only touch a handful of cells, so every
+# partial layout of those cells can be listed once, offline, grouped by the clues the lasers give (their lengths and
+# exit cells: the "signature"). Then instead of searching the opening again for every puzzle, a solver or generator
+# reads off the layouts for the signature it wants.
+#
+# Openings are only listed up to max_length cells per laser. Past that there are too many of them (the first laser
+# alone has about 10 million partial layouts on a 5x5 board), and so many per signature that reading them is no
+# faster than searching. Signatures with a longer laser aren't in the index.
+#
+# On disk the index is a directory of .npy files, opened with mmap_mode="r" so loading it costs nothing and every
+# process reading it shares the same pages:
+#   meta.json     size, number of lasers, max_length
+#   keys.npy      (signatures,) int64 signature keys, sorted
+#   offsets.npy   (signatures + 1,) int64: the layouts for keys[i] are layouts[offsets[i]:offsets[i + 1]]
+#   layouts.npy   (layouts, size * size) int8 partial start arrays, cell x * size + y, UNKNOWN for untouched cells
+
+
+class _OpeningSolver(Solver):
+    # Lists every opening, dropping beams which get cut short at max_length.
+    def __init__(self, num_lasers, size, max_length):
+        super().__init__([None] * num_lasers, size=size, max_path_len=max_length)
+
+    def _finish_beam(self, k, length, end):
+        if 0 <= end[0] < self.size and 0 <= end[1] < self.size:
+            return
+        yield from super()._finish_beam(k, length, end)
+
+
+def signature_key(signature, size, max_length):
+    """
+    Packs a signature, the (length, end location) of each opening laser, into one int. None if some laser is longer
+    than the index goes.
+    """
+    key = 0
+    for length, end in signature:
+        if length > max_length:
+            return None
+        key = (key * (max_length + 1) + int(length)) * (size + 2) ** 2 + (int(end[0]) + 1) * (size + 2) + int(end[1]) + 1
+    return key
+
+
+def build_opening_index(directory, num_lasers=2, max_length=10, size=5):
+    """
+    Lists every opening of num_lasers lasers of at most max_length cells each, and saves the index in directory.
+    Takes a few seconds for the defaults; every extra cell of max_length costs several times more.
+    """
+    solver = _OpeningSolver(num_lasers, size, max_length)
+    keys = []
+    layouts = []
+    for partial_start_array, results in solver.solutions():
+        keys.append(signature_key(results, size, max_length))
+        layouts.append(partial_start_array.ravel().astype(np.int8))
+    keys = np.array(keys, dtype=np.int64)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    unique_keys, starts = np.unique(keys, return_index=True)
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "keys.npy"), unique_keys)
+    np.save(os.path.join(directory, "offsets.npy"), np.append(starts, len(keys)).astype(np.int64))
+    np.save(os.path.join(directory, "layouts.npy"), np.array(layouts, dtype=np.int8)[order])
+    with open(os.path.join(directory, "meta.json"), 'w') as f:
+        json.dump({"size": size, "num_lasers": num_lasers, "max_length": max_length}, f)
+    return OpeningIndex(directory)
+
+
+class OpeningIndex():
+    """
+    A memory-mapped index, saved by build_opening_index, from the clues of a room's first num_lasers lasers to every
+    partial layout giving them.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.size = meta["size"]
+        self.num_lasers = meta["num_lasers"]
+        self.max_length = meta["max_length"]
+        self.keys = np.load(os.path.join(directory, "keys.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        self.layouts = np.load(os.path.join(directory, "layouts.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Pickles as just the directory, so worker processes map the same files instead of being sent copies.
+    def __getstate__(self):
+        return {"directory": self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"])
+
+    def __repr__(self):
+        return "<OpeningIndex of {} lasers up to length {}: {} signatures, {} layouts>".format(
+            self.num_lasers, self.max_length, len(self), len(self.layouts))
+
+    def covers(self, clues, size=5):
+        """
+        True if the index has every layout for the opening of these clues (launch direction, length, end location)
+        in a room of this size.
+        """
+        if size != self.size or len(clues) < self.num_lasers:
+            return False
+        for k, clue in enumerate(clues[:self.num_lasers]):
+            if clue is None or clue[0] != DEFAULT_LAUNCH_ORDER[k % len(DEFAULT_LAUNCH_ORDER)] or clue[1] > self.max_length:
+                return False
+        return True
+
+    def candidates(self, signature):
+        """
+        The partial layouts, as an (n, size * size) read-only array, whose first num_lasers lasers have the given
+        (length, end location)s. Empty if no layout gives them. Raises KeyError if the signature is past max_length.
+        """
+        key = signature_key(signature[:self.num_lasers], self.size, self.max_length)
+        if key is None:
+            raise KeyError(signature)
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return self.layouts[:0]
+        return self.layouts[self.offsets[i]:self.offsets[i + 1]]
+
+    def solutions(self, clues, max_nodes=None):
+        """
+        Like Solver(clues).solutions(), but the opening comes from the index, so the search only branches on cells
+        the later lasers reach for the first time. The clues must be covered by the index.
+        """
+        layouts = self.candidates([clue[1:] for clue in clues[:self.num_lasers]])
+        nodes = 0
+        for layout in layouts:
+            domains = [MIRROR_STATES if terrain == UNKNOWN else (terrain,) for terrain in layout.tolist()]
+            solver = Solver(clues, self.size, domains, max_nodes=None if max_nodes is None else max_nodes - nodes)
+            yield from solver.solutions()
+            nodes += solver.nodes
+
+    def random_room_layout(self, signature, mirror_prob=0.6, rng=None):
+        """
+        A full starting layout whose first num_lasers lasers have the given (length, end location)s, drawn as
+        random_terrain would draw it given that. None if no layout gives them.
+        """
+        if rng is None:
+            rng = np.random
+        layouts = self.candidates(signature)
+        if len(layouts) == 0:
+            return None
+        # Each partial layout is as likely as its known cells are under random_terrain.
+        flats = np.sum(layouts == Terrain.FLAT, axis=1)
+        mirrors = np.sum((layouts == Terrain.UL) | (layouts == Terrain.UR), axis=1)
+        log_weights = flats * np.log(1 - mirror_prob) + mirrors * np.log(mirror_prob / 2)
+        weights = np.exp(log_weights - log_weights.max())
+        layout = layouts[rng.choice(len(layouts), p=weights / weights.sum())]
+        return complete_layout(np.asarray(layout).reshape(self.size, self.size), mirror_prob, rng)
+
+
+if __name__ == "__main__":
+    # python lasercats_opening.py DIRECTORY [NUM_LASERS [MAX_LENGTH [SIZE]]]
+    args = [int(a) for a in sys.argv[2:]]
+    print(build_opening_index(sys.argv[1], *args))
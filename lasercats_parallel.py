@@ -0,0 +1,98 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from lasercats import PuzzleRecord, Room
+
+# Parallel versions of run_lots / make_puzzle. Rooms are generated in chunks on a process pool; chunk k draws
+# from its own np.random.Generator, spawned from the master seed, so the output only depends on the seed and
+# the chunk size, not on the number of processes or on scheduling.
+#
+# Callbacks run in the worker processes, so anything they do as a side effect (appending to a global list,
+# writing files) stays there. Instead, each accepted room comes back to the parent as a PuzzleRecord.
+
+
+def _run_chunk(seed_seq, first_room_index, num_rooms, max_paths, accept, min_difficulty, room_class):
+    rng = np.random.default_rng(seed_seq)
+    records = []
+    for room_index in range(first_room_index, first_room_index + num_rooms):
+        def valid_puzzle_found_callback(room):
+            if accept is not None and not accept(room):
+                return False
+            records.append(PuzzleRecord.from_room(room, room_index=room_index))
+            return True
+        room = room_class(rng=rng)
+        room.launch_lotsa_lasers(max_paths, valid_puzzle_found_callback, min_heuristic_breakin_score=min_difficulty)
+    return records
+
+
+def iter_lots_parallel(num_rooms, max_paths, accept=None, min_difficulty=6, seed=None, processes=None,
+                       chunk_size=100, room_class=Room):
+    """
+    Generates num_rooms rooms on a process pool and yields a PuzzleRecord for every accepted (room, final path),
+    ordered by room index and then path index.
+
+    :param accept: a picklable (module-level) function which takes a Room and returns True if it is a valid final
+        grid, like valid_puzzle_found_callback. If None, every room which passes the heuristic filters is accepted.
+    :param seed: master seed. The same seed and chunk_size always give the same records in the same order.
+    :param processes: number of worker processes; defaults to os.cpu_count().
+    :param chunk_size: number of rooms per task (and per RNG stream).
+
+    Stopping iteration early (break, or closing the generator) cancels all chunks which haven't started yet.
+    """
+    processes = processes or os.cpu_count()
+    num_chunks = (num_rooms + chunk_size - 1) // chunk_size
+    seed_seqs = np.random.SeedSequence(seed).spawn(num_chunks)
+
+    executor = ProcessPoolExecutor(max_workers=processes)
+    pending = []
+    next_chunk = 0
+    try:
+        while pending or next_chunk < num_chunks:
+            # Keep a couple of chunks per worker queued, but no more, so that cancelling is cheap.
+            while next_chunk < num_chunks and len(pending) < 2 * processes:
+                first_room_index = next_chunk * chunk_size
+                pending.append(executor.submit(
+                    _run_chunk, seed_seqs[next_chunk], first_room_index,
+                    min(chunk_size, num_rooms - first_room_index),
+                    max_paths, accept, min_difficulty, room_class,
+                ))
+                next_chunk += 1
+            for record in pending.pop(0).result():
+                yield record
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def run_lots_parallel(num_rooms, max_paths, accept=None, min_difficulty=6, seed=None, processes=None,
+                      chunk_size=100, room_class=Room, max_records=None):
+    """
+    Like run_lots, but in parallel, and returns the accepted PuzzleRecords instead of relying on callbacks.
+    Stops early once max_records records have been found.
+    """
+    records = []
+    for record in iter_lots_parallel(num_rooms, max_paths, accept=accept, min_difficulty=min_difficulty, seed=seed,
+                                     processes=processes, chunk_size=chunk_size, room_class=room_class):
+        records.append(record)
+        if max_records is not None and len(records) >= max_records:
+            break
+    return records
+
+
+def make_puzzle_parallel(min_difficulty=8, max_paths=12, ntries=1000, seed=None, processes=None, chunk_size=10):
+    """
+    Like make_puzzle, but tries up to ntries rooms in parallel and stops all workers as soon as one is found.
+    Returns the Room rebuilt at its final path, or None.
+    """
+    records = run_lots_parallel(ntries, max_paths, min_difficulty=min_difficulty, seed=seed, processes=processes,
+                                chunk_size=chunk_size, max_records=1)
+    if not records:
+        print("Puzzle construction failed {} times.".format(ntries))
+        return None
+    return records[0].to_room()
+
+
+if __name__ == "__main__":
+    r = make_puzzle_parallel(seed=0)
+    print(r.pretty_print_puzzle())
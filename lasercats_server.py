@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from lasercats import iter_puzzles
+from lasercats_fast import FastRoom
+
+# A local service which hands out puzzles straight away instead of generating them on request. Each difficulty band
+# (a range of heuristic_breakin_score) keeps a queue of ready puzzles, and whenever one runs below low_watermark,
+# jobs go out to a process pool to top it up. Generation never runs on the event loop, and a band never has more
+# than jobs_per_band jobs out or more than capacity puzzles waiting, so a burst of requests can't pile up work.
+#
+# The protocol is one line per request over TCP:
+#   GET <band> [text|json]    -> the puzzle as Room.pretty_print_puzzle() text, or its PuzzleRecord.to_dict() as JSON,
+#                                then a line with just "."
+#   STATUS                    -> JSON with how many puzzles each band has ready and how many jobs it has out
+# Errors come back as a line starting with "ERROR".
+
+# name -> (min difficulty, max difficulty or None)
+DEFAULT_BANDS = {
+    "easy": (4, 5),
+    "medium": (6, 7),
+    "hard": (8, None),
+}
+DEFAULT_PORT = 8642
+
+
+def _generate(min_difficulty, max_difficulty, want, max_rooms, seed_seq, max_paths, accept, room_class):
+    # Runs in a worker: up to `want` puzzles in the band from up to max_rooms rooms, one per room, as
+    # (record dict, text) so the server doesn't have to replay them.
+    def in_band(room):
+        if max_difficulty is not None and room.heuristic_breakin_score > max_difficulty:
+            return False
+        return accept is None or accept(room)
+    found = []
+    last_room = None
+    for record in iter_puzzles(max_rooms, max_paths, in_band, min_difficulty, room_class,
+                               rng=np.random.default_rng(seed_seq)):
+        if record.room_index == last_room:
+            continue # Puzzles from the same room share most of their clues.
+        last_room = record.room_index
+        found.append((record.to_dict(), record.to_room().pretty_print_puzzle()))
+        if len(found) >= want:
+            break
+    return found
+
+
+class PuzzleServer():
+    def __init__(self, bands=None, capacity=50, low_watermark=20, processes=None, jobs_per_band=2, puzzles_per_job=10,
+                 rooms_per_job=5000, max_paths=12, accept=None, room_class=FastRoom, seed=None):
+        """
+        :param bands: dict of band name to (min difficulty, max difficulty or None). Defaults to DEFAULT_BANDS.
+        :param capacity: most puzzles to keep ready per band.
+        :param low_watermark: start refilling a band once it has fewer than this many ready.
+        :param accept: optional picklable (module-level) function, which takes a Room and returns True if it's a valid
+            final grid, e.g. lasercats_solver.RequireUniqueAnswer().
+        """
+        self.bands = dict(DEFAULT_BANDS if bands is None else bands)
+        self.capacity = capacity
+        self.low_watermark = low_watermark
+        self.processes = processes or os.cpu_count()
+        self.jobs_per_band = jobs_per_band
+        self.puzzles_per_job = puzzles_per_job
+        self.rooms_per_job = rooms_per_job
+        self.max_paths = max_paths
+        self.accept = accept
+        self.room_class = room_class
+        self.seed_seq = np.random.SeedSequence(seed)
+        self.queues = {}
+        self.jobs = {band: 0 for band in self.bands}
+        self.wakeups = {}
+        self.executor = None
+        self.tasks = []
+
+    def __repr__(self):
+        return "<PuzzleServer {}>".format(", ".join(
+            "{}: {} ready".format(band, queue.qsize()) for band, queue in self.queues.items()))
+
+    async def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.processes)
+        for band in self.bands:
+            self.queues[band] = asyncio.Queue(maxsize=self.capacity)
+            self.wakeups[band] = asyncio.Event()
+            self.wakeups[band].set()
+            self.tasks.append(asyncio.create_task(self._refill(band)))
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _refill(self, band):
+        # Keeps up to jobs_per_band jobs out while the band is below low_watermark (counting what's on the way).
+        min_difficulty, max_difficulty = self.bands[band]
+        queue = self.queues[band]
+        loop = asyncio.get_running_loop()
+        running = set()
+        while True:
+            await self.wakeups[band].wait()
+            self.wakeups[band].clear()
+            while (len(running) < self.jobs_per_band
+                   and queue.qsize() + len(running) * self.puzzles_per_job < self.low_watermark):
+                future = loop.run_in_executor(
+                    self.executor, _generate, min_difficulty, max_difficulty, self.puzzles_per_job,
+                    self.rooms_per_job, self.seed_seq.spawn(1)[0], self.max_paths, self.accept, self.room_class)
+                running.add(future)
+                future.add_done_callback(lambda f, band=band, running=running: self._job_done(band, running, f))
+            self.jobs[band] = len(running)
+
+    def _job_done(self, band, running, future):
+        running.discard(future)
+        self.jobs[band] = len(running)
+        if not future.cancelled() and future.exception() is not None:
+            print("Puzzle generation for {} failed: {!r}".format(band, future.exception()))
+        elif not future.cancelled():
+            queue = self.queues[band]
+            for puzzle in future.result():
+                if queue.full():
+                    break # Backpressure: drop the surplus rather than wait for room.
+                queue.put_nowait(puzzle)
+        self.wakeups[band].set()
+
+    async def get(self, band, timeout=None):
+        """
+        The next ready puzzle in the band, as (PuzzleRecord.to_dict(), pretty_print_puzzle() text). Waits up to
+        timeout seconds (forever if None) if none are ready; raises asyncio.TimeoutError if there's still none.
+        """
+        if band not in self.queues:
+            raise KeyError(band)
+        queue = self.queues[band]
+        self.wakeups[band].set()
+        puzzle = await asyncio.wait_for(queue.get(), timeout)
+        self.wakeups[band].set()
+        return puzzle
+
+    def status(self):
+        return {band: {"ready": self.queues[band].qsize(), "jobs": self.jobs[band]} for band in self.bands}
+
+    async def _handle(self, reader, writer, timeout):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode().split()
+                if words[:1] == ["STATUS"]:
+                    writer.write((json.dumps(self.status()) + "\n").encode())
+                elif words[:1] == ["GET"] and len(words) in (2, 3):
+                    fmt = words[2] if len(words) == 3 else "text"
+                    try:
+                        record, text = await self.get(words[1], timeout)
+                    except KeyError:
+                        writer.write("ERROR unknown band {}\n".format(words[1]).encode())
+                    except asyncio.TimeoutError:
+                        writer.write("ERROR no {} puzzle ready\n".format(words[1]).encode())
+                    else:
+                        body = json.dumps(record) if fmt == "json" else text
+                        writer.write((body + "\n.\n").encode())
+                else:
+                    writer.write(b"ERROR bad request\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT, timeout=10):
+        """
+        Serves requests until cancelled.
+        :param timeout: seconds a request waits for an empty band to refill before getting an error.
+        """
+        server = await asyncio.start_server(lambda r, w: self._handle(r, w, timeout), host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def fetch_puzzle(band="medium", fmt="text", host="127.0.0.1", port=DEFAULT_PORT):
+    """
+    Blocking client: asks a running server for a puzzle. Returns the text, or the record dict for fmt="json".
+    """
+    with socket.create_connection((host, port)) as sock:
+        f = sock.makefile("rw")
+        f.write("GET {} {}\n".format(band, fmt))
+        f.flush()
+        lines = []
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("ERROR") and not lines:
+                raise RuntimeError(line)
+            if line == ".":
+                break
+            lines.append(line)
+    body = "\n".join(lines)
+    return json.loads(body) if fmt == "json" else body
+
+
+async def _main(port):
+    async with PuzzleServer() as server:
+        print("Serving puzzles on port {}".format(port))
+        await server.serve(port=port)
+
+
+if __name__ == "__main__":
+    # python lasercats_server.py [PORT]
+    asyncio.run(_main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT))
@@ -0,0 +1,211 @@
+import numpy as np
+
+import lasercats
+from lasercats import Terrain
+from lasercats_fast import REFLECT, transition_tables
+
+# Solves Lasercats puzzles: given the clues (launch direction, path length, exit cell) of the lasers a solver sees,
+# finds every starting layout consistent with them. The search follows the beams in order, and only branches when
+# a beam enters a cell that no earlier beam has touched. All other cells are left UNKNOWN, so one partial layout
+# stands for 3^(number of UNKNOWN cells) full ones.
+
+UNKNOWN = -1
+MIRROR_STATES = (Terrain.FLAT, Terrain.UL, Terrain.UR)
+
+
+class SolverBudgetExceeded(Exception):
+    pass
+
+
+def clues_from_room(room):
+    """
+    The clues shown by room.pretty_print_puzzle(): every path except the final (to-be-solved-for) one.
+    """
+    return [(p.launch_dir_idx, len(p), tuple(int(c) for c in p.cursor_location)) for p in room.paths[:-1]]
+
+
+class Solver():
+    record_path_cells = False # keep path_cells up to date; subclasses which need it turn it on
+
+    def __init__(self, clues, size=5, domains=None, max_nodes=None, max_path_len=None):
+        """
+        :param clues: list of (launch direction index, path length, end location), one per laser in firing order.
+            A clue may be None, meaning that laser is fired (so it flips mirrors) but its result is unconstrained;
+            it then fires in direction (laser index % 4).
+        :param domains: optional list, indexed by cell (x * size + y), of the terrains each cell may start as.
+        :param max_nodes: raise SolverBudgetExceeded after simulating this many beam steps.
+        :param max_path_len: where beams are cut short; defaults to lasercats.max_path_len(size), as in Room.
+        """
+        self.size = size
+        self.clues = list(clues)
+        self.launch_dirs = [i % 4 if clue is None else clue[0] for i, clue in enumerate(self.clues)]
+        self.max_nodes = max_nodes
+        self.max_path_len = lasercats.max_path_len(size) if max_path_len is None else max_path_len
+        self.next_cell, self.cell_xy, self.exit_xy = transition_tables(size)
+
+        midpt = int((size - 1) / 2)
+        self.center = midpt * size + midpt
+        self.domains = [MIRROR_STATES] * (size * size) if domains is None else [tuple(d) for d in domains]
+        self.domains[self.center] = (Terrain.HUMAN,)
+        self.start = [UNKNOWN] * (size * size)
+        for cell, domain in enumerate(self.domains):
+            if len(domain) == 1:
+                self.start[cell] = domain[0]
+        self.current = list(self.start)
+        self.results = [None] * len(self.clues)
+        self.path_cells = [[] for _ in self.clues] # cells beam k has visited so far, if record_path_cells
+        self.nodes = 0
+
+    def _cells_left(self, cell, end):
+        # Fewest further cells a beam now in `cell` must visit to end at `end`.
+        x, y = self.cell_xy[cell]
+        distance = abs(x - end[0]) + abs(y - end[1])
+        inside = 0 <= end[0] < self.size and 0 <= end[1] < self.size
+        return distance if inside else distance - 1
+
+    def _values(self, k, cell):
+        # What beam k may find `cell` started as, in the order to try them. Subclasses can reorder or narrow this.
+        return self.domains[cell]
+
+    def solutions(self):
+        """
+        Yields (partial start array, results) for every consistent partial layout. The start array is indexed [x, y]
+        with UNKNOWN for cells no beam touches; results is the (length, end location) of each laser.
+        """
+        if not self.clues:
+            yield self._solution()
+            return
+        yield from self._search(0, self.center, self.launch_dirs[0], 0)
+
+    def _solution(self):
+        return np.array(self.start).reshape(self.size, self.size), tuple(self.results)
+
+    def _finish_beam(self, k, length, end):
+        clue = self.clues[k]
+        if clue is not None and (length != clue[1] or end != tuple(clue[2])):
+            return
+        self.results[k] = (length, end)
+        if k + 1 == len(self.clues):
+            yield self._solution()
+        else:
+            yield from self._search(k + 1, self.center, self.launch_dirs[k + 1], 0)
+
+    def _search(self, k, cell, d, length):
+        # Traces beam k on from `cell` heading `d`, having visited `length` cells so far.
+        clue = self.clues[k]
+        current = self.current
+        cells = self.path_cells[k] if self.record_path_cells else None
+        num_cells = length
+        flipped = []
+        try:
+            while True:
+                self.nodes += 1
+                if self.max_nodes is not None and self.nodes > self.max_nodes:
+                    raise SolverBudgetExceeded()
+                state = cell * 4 + d
+                nxt = self.next_cell[state]
+                if nxt < 0:
+                    yield from self._finish_beam(k, length, self.exit_xy[state])
+                    return
+                if clue is not None and length + 1 + self._cells_left(nxt, clue[2]) > clue[1]:
+                    return
+                terrain = current[nxt]
+                if terrain == UNKNOWN:
+                    # First time any beam reaches this cell: branch on what it started as.
+                    for value in self._values(k, nxt):
+                        self.start[nxt] = current[nxt] = value
+                        yield from self._search(k, cell, d, length)
+                    self.start[nxt] = current[nxt] = UNKNOWN
+                    return
+                d = REFLECT[terrain * 4 + d]
+                if terrain == Terrain.UL or terrain == Terrain.UR:
+                    current[nxt] ^= 3
+                    flipped.append(nxt)
+                cell = nxt
+                if cells is not None:
+                    cells.append(cell)
+                length += 1
+                if length > self.max_path_len:
+                    yield from self._finish_beam(k, length, self.cell_xy[cell])
+                    return
+        finally:
+            for c in reversed(flipped):
+                current[c] ^= 3
+            if cells is not None:
+                del cells[num_cells:]
+
+
+def count_layouts(partial_start_array):
+    """
+    Number of full starting layouts a partial layout stands for.
+    """
+    return 3 ** int(np.sum(partial_start_array == UNKNOWN))
+
+
+def solve(clues, size=5, max_nodes=None):
+    """
+    Returns every partial starting layout consistent with the clues.
+    """
+    return [start for start, _ in Solver(clues, size=size, max_nodes=max_nodes).solutions()]
+
+
+def answers(clues, size=5, max_answers=None, max_nodes=None, opening_index=None):
+    """
+    The set of (length, end location) the next laser can have, over all layouts consistent with the clues.
+    Stops looking once max_answers different answers have been found.
+    :param opening_index: optional lasercats_opening.OpeningIndex to read the first lasers' layouts from, when it
+        covers their clues.
+    """
+    found = set()
+    clues = list(clues) + [None]
+    if opening_index is not None and opening_index.covers(clues, size):
+        solutions = opening_index.solutions(clues, max_nodes=max_nodes)
+    else:
+        solutions = Solver(clues, size=size, max_nodes=max_nodes).solutions()
+    for _, results in solutions:
+        found.add(results[-1])
+        if max_answers is not None and len(found) >= max_answers:
+            break
+    return found
+
+
+def has_unique_answer(room, max_nodes=None, opening_index=None):
+    """
+    True if room.paths[:-1] force room.paths[-1]: the printed puzzle has exactly one answer.
+    """
+    final = room.paths[-1]
+    found = answers(clues_from_room(room), size=room.size, max_answers=2, max_nodes=max_nodes,
+                    opening_index=opening_index)
+    return found == {(len(final), tuple(int(c) for c in final.cursor_location))}
+
+
+class RequireUniqueAnswer():
+    """
+    Wraps a valid_puzzle_found_callback so that rooms whose puzzle has more than one answer are rejected before the
+    callback sees them. Rooms which take more than max_nodes steps to check are rejected too.
+    Picklable (if the wrapped callback is), so it can be used with lasercats_parallel.
+    :param grader: optional lasercats_grader.Grader. Its grades already hold every answer, so if the same grader is
+        filtering on difficulty, this reads the answers from its cache instead of solving the puzzle again.
+    :param opening_index: optional lasercats_opening.OpeningIndex, so the first lasers aren't searched again for
+        every room. Memory-mapped, so worker processes share it.
+    """
+    def __init__(self, valid_puzzle_found_callback=None, max_nodes=200000, grader=None, opening_index=None):
+        self.valid_puzzle_found_callback = valid_puzzle_found_callback
+        self.max_nodes = max_nodes
+        self.grader = grader
+        self.opening_index = opening_index
+
+    def __call__(self, room):
+        if self.grader is not None:
+            grade = self.grader(room)
+            if grade is None or not grade.unique:
+                return False
+        else:
+            try:
+                if not has_unique_answer(room, max_nodes=self.max_nodes, opening_index=self.opening_index):
+                    return False
+            except SolverBudgetExceeded:
+                return False
+        if self.valid_puzzle_found_callback is None:
+            return True
+        return self.valid_puzzle_found_callback(room)
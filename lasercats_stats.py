@@ -0,0 +1,126 @@
+import contextlib
+import json
+import time
+from collections import Counter
+
+from lasercats import ending_side
+
+# Opt-in instrumentation for launch_lotsa_lasers / run_lots. Pass a LaserStats as `stats=` and it counts which filter
+# threw each candidate final path away, how long the paths were and where they exited, and where the time went.
+# The counts are what you need to pick max_paths and min_difficulty: e.g. if most candidates die at
+# "room_not_visited", more lasers per room will help; the breakin_scores histogram shows what a given
+# min_difficulty costs.
+
+# In the order launch_lotsa_lasers checks them.
+REJECTION_REASONS = (
+    "path_not_visited", # the final path goes through a cell no earlier path visited
+    "room_not_visited", # only_extract_after_all_visited, and some cell wasn't visited before the final path
+    "midgame_score", # heuristic_midgame_score < min_heuristic_midgame_score
+    "breakin_score", # heuristic_breakin_score (or the grader's breakin_score) < min_heuristic_breakin_score
+    "callback", # valid_puzzle_found_callback returned a falsy value
+)
+EXIT_SIDES = ("N", "E", "S", "W")
+TRUNCATED = "truncated" # the path was stopped at room.max_path_len before reaching a wall (see Path.truncated)
+
+
+class LaserStats():
+    def __init__(self):
+        self.rooms = 0
+        self.lasers = 0
+        self.accepted = 0
+        self.pruned = 0 # rooms abandoned early because the lasers left couldn't reach the minimum scores
+        self.rejections = Counter()
+        self.path_lengths = Counter()
+        self.exit_sides = Counter()
+        self.breakin_scores = Counter() # of candidates reaching the breakin_score filter
+        self.accepted_at_laser = Counter() # how many lasers had been fired when a puzzle was accepted
+        self.timings = Counter() # seconds spent per stage: "simulate", "heuristics", "grade", "callback"
+
+    def __repr__(self):
+        return "<LaserStats {} rooms, {} lasers, {} accepted>".format(self.rooms, self.lasers, self.accepted)
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] += time.perf_counter() - start
+
+    def record_path(self, path):
+        self.lasers += 1
+        self.path_lengths[len(path)] += 1
+        side = ending_side(path.cursor_location, path.room.size)
+        self.exit_sides[TRUNCATED if side is None else EXIT_SIDES[side]] += 1
+
+    def reject(self, reason):
+        assert reason in REJECTION_REASONS, reason
+        self.rejections[reason] += 1
+
+    def accept(self, num_paths):
+        self.accepted += 1
+        self.accepted_at_laser[num_paths] += 1
+
+    def merge(self, other):
+        """
+        Adds another LaserStats' counts into this one, e.g. to combine runs from several processes.
+        """
+        self.rooms += other.rooms
+        self.lasers += other.lasers
+        self.accepted += other.accepted
+        self.pruned += other.pruned
+        for name in ("rejections", "path_lengths", "exit_sides", "breakin_scores", "accepted_at_laser", "timings"):
+            getattr(self, name).update(getattr(other, name))
+        return self
+
+    def to_dict(self):
+        """
+        JSON-friendly version of the stats. Histogram keys become strings.
+        """
+        return {
+            "rooms": self.rooms,
+            "lasers": self.lasers,
+            "accepted": self.accepted,
+            "pruned": self.pruned,
+            "rejections": {reason: self.rejections[reason] for reason in REJECTION_REASONS},
+            "path_lengths": {str(k): v for k, v in sorted(self.path_lengths.items())},
+            "exit_sides": dict(self.exit_sides),
+            "breakin_scores": {str(k): v for k, v in sorted(self.breakin_scores.items())},
+            "accepted_at_laser": {str(k): v for k, v in sorted(self.accepted_at_laser.items())},
+            "timings": dict(self.timings),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls()
+        stats.rooms, stats.lasers, stats.accepted = d["rooms"], d["lasers"], d["accepted"]
+        stats.pruned = d.get("pruned", 0)
+        stats.rejections.update(d["rejections"])
+        stats.path_lengths.update({int(k): v for k, v in d["path_lengths"].items()})
+        stats.exit_sides.update(d["exit_sides"])
+        stats.breakin_scores.update({int(k): v for k, v in d["breakin_scores"].items()})
+        stats.accepted_at_laser.update({int(k): v for k, v in d["accepted_at_laser"].items()})
+        stats.timings.update(d["timings"])
+        return stats
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary(self):
+        lines = ["{} rooms ({} pruned), {} lasers, {} accepted".format(self.rooms, self.pruned, self.lasers,
+                                                                      self.accepted)]
+        remaining = self.lasers
+        for reason in REJECTION_REASONS:
+            n = self.rejections[reason]
+            lines.append("  rejected by {:<18} {:>9} ({:.1%} of those left)".format(
+                reason, n, n / remaining if remaining else 0))
+            remaining -= n
+        total_time = sum(self.timings.values())
+        for stage, seconds in sorted(self.timings.items()):
+            lines.append("  {:<30} {:>9.3f}s ({:.1%})".format(stage, seconds, seconds / total_time if total_time else 0))
+        lines.append("  exit sides: " + ", ".join("{}={}".format(k, v) for k, v in sorted(self.exit_sides.items())))
+        lines.append("  path lengths: " + ", ".join("{}:{}".format(k, v) for k, v in sorted(self.path_lengths.items())))
+        lines.append("  breakin scores: " + ", ".join(
+            "{}:{}".format(k, v) for k, v in sorted(self.breakin_scores.items())))
+        return "\n".join(lines)
@@ -0,0 +1,126 @@
+import json
+import os
+import sys
+
+from lasercats import PuzzleRecord
+
+# An append-only store of accepted puzzles, replacing one rendered text file per puzzle. Records are JSON lines
+# (see PuzzleRecord.to_dict) in `puzzles.jsonl`; `index.jsonl` has one small line per record with its byte offset,
+# answer slot and difficulty, so lookups don't have to parse the whole store. Text is only rendered on demand.
+
+DATA_FILE = "puzzles.jsonl"
+INDEX_FILE = "index.jsonl"
+
+
+class PuzzleStore():
+    def __init__(self, directory, buffer_size=1000):
+        """
+        :param buffer_size: records are written in bulk once this many are waiting (or on flush/close).
+        """
+        self.directory = directory
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.index = []
+        os.makedirs(directory, exist_ok=True)
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = [json.loads(line) for line in f if line.strip()]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.index) + len(self.buffer)
+
+    def append(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def extend(self, records):
+        """
+        Appends every record from an iterable, e.g. lasercats.iter_puzzles(...). Returns how many were added.
+        """
+        n = 0
+        for record in records:
+            self.append(record)
+            n += 1
+        return n
+
+    def flush(self):
+        if not self.buffer:
+            return
+        index_entries = []
+        with open(os.path.join(self.directory, DATA_FILE), 'ab') as f:
+            for record in self.buffer:
+                index_entries.append({
+                    "offset": f.tell(),
+                    "answer_index": None if record.answer_index is None else int(record.answer_index),
+                    "difficulty": record.heuristic_breakin_score,
+                })
+                f.write((json.dumps(record.to_dict()) + "\n").encode())
+        with open(os.path.join(self.directory, INDEX_FILE), 'a') as f:
+            for entry in index_entries:
+                f.write(json.dumps(entry) + "\n")
+        self.index.extend(index_entries)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def truncate(self, n):
+        """
+        Throws away every record after the first n, e.g. ones written after the checkpoint a run is resuming from.
+        """
+        self.flush()
+        if n >= len(self.index):
+            return
+        offset = self.index[n]["offset"]
+        with open(os.path.join(self.directory, DATA_FILE), 'r+b') as f:
+            f.truncate(offset)
+        self.index = self.index[:n]
+        with open(os.path.join(self.directory, INDEX_FILE), 'w') as f:
+            for entry in self.index:
+                f.write(json.dumps(entry) + "\n")
+
+    def counts_by_answer_index(self):
+        counts = {}
+        for entry in self.index:
+            counts[entry["answer_index"]] = counts.get(entry["answer_index"], 0) + 1
+        return counts
+
+    def find(self, answer_index=None, min_difficulty=None):
+        """
+        Yields the stored records for one answer slot and/or at least some difficulty, in the order they were added.
+        """
+        self.flush()
+        entries = [e for e in self.index
+                   if (answer_index is None or e["answer_index"] == answer_index)
+                   and (min_difficulty is None or e["difficulty"] >= min_difficulty)]
+        if not entries:
+            return
+        with open(os.path.join(self.directory, DATA_FILE), 'rb') as f:
+            for entry in entries:
+                f.seek(entry["offset"])
+                yield PuzzleRecord.from_dict(json.loads(f.readline()))
+
+
+def render(record):
+    """
+    The same text Room.pretty_print_puzzle (and so the old dump_puzzle) gives for this puzzle.
+    """
+    return record.to_room().pretty_print_puzzle()
+
+
+if __name__ == "__main__":
+    # python lasercats_store.py STORE_DIR [ANSWER_INDEX [MIN_DIFFICULTY]]
+    store = PuzzleStore(sys.argv[1])
+    answer_index = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    min_difficulty = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    for record in store.find(answer_index, min_difficulty):
+        print(render(record))
+        print()
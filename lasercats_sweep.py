@@ -0,0 +1,215 @@
+import itertools
+import math
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from lasercats import Room
+
+# Measures how the generator's settings trade off against each other. Every Setting in a grid is run in batches of
+# rooms on a process pool, and for each one we estimate the chance that a room gives at least one accepted puzzle of
+# the target difficulty, with a Wilson confidence interval, and how many such rooms come out per CPU-second.
+#
+# Puzzles from the same room share most of their clues, so rooms rather than puzzles are the independent samples the
+# intervals are taken over; puzzles per CPU-second is reported as well.
+#
+# The settings race each other: once a setting's optimistic yield (the top of its interval, times its rooms per
+# CPU-second) is below the pessimistic yield of the best setting so far, it's hopeless and stops getting batches.
+# Batch results depend on the seed only, but which settings get dropped when depends on timing.
+
+Setting = namedtuple("Setting", ["mirror_prob", "max_paths", "min_difficulty", "min_heuristic_midgame_score",
+                                 "only_extract_after_all_visited"])
+
+DEFAULT_GRID = {
+    "mirror_prob": (0.4, 0.5, 0.6, 0.7, 0.8),
+    "max_paths": (10, 12, 14),
+    "min_difficulty": (6, 8),
+    "min_heuristic_midgame_score": (2, 4),
+    "only_extract_after_all_visited": (True, False),
+}
+
+
+def settings_grid(**values):
+    """
+    Every combination of the given values, e.g. settings_grid(mirror_prob=(0.5, 0.6)). Fields which aren't given
+    take their values from DEFAULT_GRID.
+    """
+    grid = dict(DEFAULT_GRID, **values)
+    return [Setting(*combo) for combo in itertools.product(*(grid[field] for field in Setting._fields))]
+
+
+def wilson_interval(successes, trials, z=1.96):
+    """
+    Wilson score interval for a binomial proportion. z=1.96 gives 95% confidence. (0, 1) if there are no trials.
+    """
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+class SweepResult():
+    def __init__(self, setting):
+        self.setting = setting
+        self.rooms = 0
+        self.successes = 0 # rooms which gave at least one accepted puzzle of the target difficulty
+        self.puzzles = 0
+        self.cpu_seconds = 0.0
+        self.stopped_early = False
+
+    def __repr__(self):
+        return "<SweepResult {}: {}/{} rooms, {:.3g} successes/s{}>".format(
+            self.setting, self.successes, self.rooms, self.yield_per_second,
+            ", stopped early" if self.stopped_early else "")
+
+    def add(self, rooms, successes, puzzles, cpu_seconds):
+        self.rooms += rooms
+        self.successes += successes
+        self.puzzles += puzzles
+        self.cpu_seconds += cpu_seconds
+
+    def acceptance_interval(self, z=1.96):
+        return wilson_interval(self.successes, self.rooms, z)
+
+    @property
+    def acceptance(self):
+        return self.successes / self.rooms if self.rooms else 0.0
+
+    def yield_interval(self, z=1.96):
+        """
+        Confidence interval on successful rooms per CPU-second. Only the acceptance rate is treated as uncertain.
+        """
+        rooms_per_second = self.rooms / self.cpu_seconds if self.cpu_seconds else 0.0
+        low, high = self.acceptance_interval(z)
+        return low * rooms_per_second, high * rooms_per_second
+
+    @property
+    def yield_per_second(self):
+        """
+        Successful rooms per CPU-second.
+        """
+        return self.successes / self.cpu_seconds if self.cpu_seconds else 0.0
+
+    @property
+    def puzzles_per_second(self):
+        return self.puzzles / self.cpu_seconds if self.cpu_seconds else 0.0
+
+
+def _run_batch(setting, seed_seq, num_rooms, target, accept, room_class):
+    rng = np.random.default_rng(seed_seq)
+    successes = 0
+    puzzles = 0
+    start = time.process_time()
+    for _ in range(num_rooms):
+        found = 0
+        def valid_puzzle_found_callback(room):
+            nonlocal found
+            if room.heuristic_breakin_score < target or (accept is not None and not accept(room)):
+                return False
+            found += 1
+            return True
+        room = room_class(mirror_prob=setting.mirror_prob, rng=rng)
+        room.launch_lotsa_lasers(setting.max_paths, valid_puzzle_found_callback,
+                                 only_extract_after_all_visited=setting.only_extract_after_all_visited,
+                                 min_heuristic_breakin_score=setting.min_difficulty,
+                                 min_heuristic_midgame_score=setting.min_heuristic_midgame_score)
+        successes += found > 0
+        puzzles += found
+    return num_rooms, successes, puzzles, time.process_time() - start
+
+
+def _hopeless(result, best, min_rooms, max_rooms, z):
+    if result is best or result.rooms < min_rooms or result.rooms >= max_rooms or best.rooms < min_rooms:
+        return False
+    return result.yield_interval(z)[1] < best.yield_interval(z)[0]
+
+
+def run_sweep(settings, target=6, accept=None, rooms_per_batch=200, min_rooms=400, max_rooms=10000, seed=None,
+              processes=None, room_class=Room, z=1.96, progress=None):
+    """
+    Runs every setting until it has tried max_rooms rooms or is clearly beaten, and returns a SweepResult for each,
+    best first.
+
+    :param target: only puzzles with at least this heuristic_breakin_score count as accepted. Settings whose
+        min_difficulty is below it still run; they just pay for the extra candidates they let through.
+    :param accept: optional picklable (module-level) function, which takes a Room and returns True if it's a valid
+        final grid, as in lasercats_parallel. E.g. a RequireUniqueAnswer, to measure the yield after the solver.
+    :param min_rooms: never drop a setting before it, and the best one, have tried this many rooms.
+    :param z: width of the confidence intervals, in standard deviations.
+    :param progress: optional function called with the SweepResult each time a batch comes back.
+    """
+    processes = processes or os.cpu_count()
+    results = [SweepResult(setting) for setting in settings]
+    # One stream of batch seeds per setting, so adding a setting to the grid doesn't change the others' rooms.
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(results))
+    submitted = [0] * len(results)
+    live = list(range(len(results)))
+    turn = 0
+
+    executor = ProcessPoolExecutor(max_workers=processes)
+    pending = {}
+    try:
+        while True:
+            # Keep a couple of batches per worker in flight, shared round-robin over the live settings.
+            while len(pending) < 2 * processes and any(submitted[i] < max_rooms for i in live):
+                i = live[turn % len(live)]
+                turn += 1
+                if submitted[i] >= max_rooms:
+                    continue
+                num_rooms = min(rooms_per_batch, max_rooms - submitted[i])
+                future = executor.submit(_run_batch, results[i].setting, seed_seqs[i].spawn(1)[0], num_rooms, target,
+                                         accept, room_class)
+                pending[future] = i
+                submitted[i] += num_rooms
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                results[i].add(*future.result())
+                if progress is not None:
+                    progress(results[i])
+            best = max((results[i] for i in live), key=lambda r: r.yield_interval(z)[0])
+            for i in list(live):
+                if _hopeless(results[i], best, min_rooms, max_rooms, z):
+                    results[i].stopped_early = True
+                    live.remove(i)
+            # Batches already queued for dropped settings are cancelled; ones already running are still counted.
+            for future, i in list(pending.items()):
+                if i not in live and future.cancel():
+                    del pending[future]
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return sorted(results, key=lambda r: r.yield_per_second, reverse=True)
+
+
+def best_setting(results, z=1.96):
+    """
+    The setting with the best pessimistic (lower end of the interval) yield, among those which weren't stopped early.
+    """
+    return max((r for r in results if not r.stopped_early), key=lambda r: r.yield_interval(z)[0]).setting
+
+
+def summary(results, z=1.96):
+    lines = ["{:>6} {:>5} {:>4} {:>4} {:>5} {:>7} {:>17} {:>10} {:>10}".format(
+        "mirror", "paths", "diff", "mid", "all", "rooms", "acceptance", "yield/s", "puzzles/s")]
+    for r in results:
+        s = r.setting
+        low, high = r.acceptance_interval(z)
+        lines.append("{:>6} {:>5} {:>4} {:>4} {:>5} {:>7} {:>5.3f} [{:.3f},{:.3f}] {:>10.3g} {:>10.3g}{}".format(
+            s.mirror_prob, s.max_paths, s.min_difficulty, s.min_heuristic_midgame_score,
+            "y" if s.only_extract_after_all_visited else "n", r.rooms, r.acceptance, low, high,
+            r.yield_per_second, r.puzzles_per_second, " (stopped early)" if r.stopped_early else ""))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    sweep_results = run_sweep(settings_grid(), target=8, seed=0)
+    print(summary(sweep_results))
+    print("Best:", best_setting(sweep_results))
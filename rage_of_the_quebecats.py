@@ -1,38 +1,158 @@
 import os
+import time
 
-from lasercats import run_lots
+from lasercats import PuzzleRecord
+from lasercats_checkpoint import ResumableRun
+from lasercats_construct import construct_room
+from lasercats_dedup import FingerprintIndex, SkipSeenPuzzles
+from lasercats_solver import RequireUniqueAnswer
+from lasercats_store import PuzzleStore
 
 
 # np.random.seed(10)
 
 ANSWER = "LIVIDFELID"
-WORKING_GRIDS = [[] for _ in ANSWER]
 OUTPUT_DIR = "/Users/dfarhi/Desktop/LaserCats"
+QUOTA = 10 # Stop once every letter of ANSWER has this many candidate rooms.
+CONSTRUCTIVE = False # Build rooms for the open slots with lasercats_construct, rather than waiting for random ones.
+                     # Only the short letters construct well (see lasercats_construct); slots it gives up on are
+                     # left for the random search.
+TIME_BUDGET = None # Seconds to run for. Running again picks up where it stopped: the store and seen fingerprints
+                   # are kept either way, and the random search also checkpoints where it got to.
 
-def output_if_puzzle_extracts_letter(room):
-    path = room.paths[-1]
-    path_idx = len(room.paths)
-    letter = chr(len(path) + 64)
-    end_location = path.cursor_location
+def extracted_answer_index(end_location, size=5):
+    """
+    The position in ANSWER a final path ending at end_location would give a letter for. None if it's a side wall.
+    The north wall gives positions 0 to size - 1 and the south wall size to 2 * size - 1, west to east.
+    """
     if end_location[1] == -1:
-        answer_idx = end_location[0]
-    elif end_location[1] == 5:
-        answer_idx = end_location[0] + 5
-    else:
-        # Path ended due to horizontal wall. Forget about it.
-        return False
-    if ANSWER[answer_idx] == letter:
-        print(
-            "Made a path of difficulty {} which would put a {} at position {}".format(path.heuristic_breakin_score, letter,
-                                                                                      answer_idx))
-        WORKING_GRIDS[answer_idx].append((room, path_idx))
-        room.dump_puzzle(os.path.join(OUTPUT_DIR, str(answer_idx)))
-        return True
-    return False
-
-
-
-run_lots(10000, 12, output_if_puzzle_extracts_letter)
+        return int(end_location[0])
+    elif end_location[1] == size:
+        return int(end_location[0]) + size
+    # Path ended due to horizontal wall. Forget about it.
+    return None
+
+def slot_exit(answer_idx, size=5):
+    """
+    Where a final path has to exit to give a letter for position answer_idx. Inverse of extracted_answer_index.
+    """
+    if answer_idx < size:
+        return (answer_idx, -1)
+    return (answer_idx - size, size)
+
+class SlotScheduler():
+    """
+    Tracks how many candidate rooms each slot of the answer has, so work stops going into slots which are full.
+    """
+    def __init__(self, answer, quota):
+        self.answer = answer
+        self.quota = quota
+        self.counts = [0 for _ in answer]
+
+    def needs(self, path):
+        """
+        Cheap check of whether path, as the final path, would extract a letter for a slot that still needs rooms.
+        """
+        answer_idx = extracted_answer_index(path.cursor_location, path.room.size)
+        if answer_idx is None or answer_idx >= len(self.answer) or self.counts[answer_idx] >= self.quota:
+            return False
+        return self.answer[answer_idx] == chr(len(path) + 64)
+
+    def restore(self, store):
+        """
+        Counts the rooms an earlier run already put in the store.
+        """
+        for answer_idx, count in store.counts_by_answer_index().items():
+            if answer_idx is not None and answer_idx < len(self.counts):
+                self.counts[answer_idx] = count
+
+    def record(self, answer_idx):
+        self.counts[answer_idx] += 1
+        if self.counts[answer_idx] == self.quota:
+            print("Slot {} ({}) is full. Still open: {}".format(
+                answer_idx, self.answer[answer_idx], self.open_slots))
+
+    @property
+    def open_slots(self):
+        return [i for i, count in enumerate(self.counts) if count < self.quota]
+
+    @property
+    def done(self):
+        return not self.open_slots
+
+    def only_needed(self, valid_puzzle_found_callback):
+        """
+        Wraps a callback so it only sees rooms whose final path fills an open slot. Put this outermost, so the
+        expensive checks inside never run for letters we already have enough of.
+        """
+        def callback(room):
+            if not self.needs(room.paths[-1]):
+                return False
+            return valid_puzzle_found_callback(room)
+        return callback
+
+SCHEDULER = SlotScheduler(ANSWER, QUOTA)
+
+def label_extracted_letter(record):
+    """
+    Fills in which slot of ANSWER the record's final path gives a letter for, and which letter.
+    """
+    record.answer_index = extracted_answer_index(record.end_locations[-1], record.size)
+    record.letter = chr(record.path_lengths[-1] + 64)
+    return record
+
+def iter_constructed_puzzles(accept, max_paths=12, restarts_per_slot=100, max_misses=8, rng=None, time_budget=None):
+    """
+    Constructive version of iter_puzzles for ANSWER: takes turns over SCHEDULER's open slots, building rooms whose
+    final path gives that slot's letter, with the final path anywhere from laser max_paths - 3 to max_paths.
+    Yields a PuzzleRecord for each room accept takes.
+    :param max_misses: give up on a slot after this many construct_room calls in a row find nothing for it.
+    :param time_budget: stop, between slots, once this many seconds have passed.
+    """
+    start = time.monotonic()
+    num_paths = max_paths
+    misses = [0] * len(ANSWER)
+    while not SCHEDULER.done:
+        slots = [answer_idx for answer_idx in SCHEDULER.open_slots if misses[answer_idx] < max_misses]
+        if not slots:
+            print("Gave up constructing slots {}.".format(SCHEDULER.open_slots))
+            return
+        for answer_idx in slots:
+            if time_budget is not None and time.monotonic() - start >= time_budget:
+                print("Out of time.")
+                return
+            room = construct_room(num_paths, ord(ANSWER[answer_idx]) - 64, slot_exit(answer_idx), accept,
+                                  max_restarts=restarts_per_slot, rng=rng)
+            if room is None:
+                misses[answer_idx] += 1
+                print("No room for slot {} ({}) with {} paths in {} searches.".format(
+                    answer_idx, ANSWER[answer_idx], num_paths, restarts_per_slot))
+                if misses[answer_idx] == max_misses:
+                    print("Giving up constructing slot {} ({}).".format(answer_idx, ANSWER[answer_idx]))
+            else:
+                misses[answer_idx] = 0
+                yield PuzzleRecord.from_room(room)
+        num_paths = num_paths - 1 if num_paths > max_paths - 3 else max_paths
+
+if __name__ == "__main__":
+    seen = FingerprintIndex(os.path.join(OUTPUT_DIR, "seen_fingerprints.txt"))
+    # SCHEDULER.only_needed also checks that the final path extracts the right letter for its slot.
+    accept = SCHEDULER.only_needed(SkipSeenPuzzles(RequireUniqueAnswer(), seen))
+    with PuzzleStore(os.path.join(OUTPUT_DIR, "puzzles")) as store:
+        if CONSTRUCTIVE:
+            puzzles = iter_constructed_puzzles(accept, time_budget=TIME_BUDGET)
+        else:
+            puzzles = ResumableRun(os.path.join(OUTPUT_DIR, "checkpoint.json"), 1000000, 12, accept, store=store,
+                                   time_budget=TIME_BUDGET, seen=seen)
+        SCHEDULER.restore(store)
+        for record in map(label_extracted_letter, puzzles):
+            print("Made a path of difficulty {} which would put a {} at position {}".format(
+                record.heuristic_breakin_score, record.letter, record.answer_index))
+            store.append(record)
+            SCHEDULER.record(record.answer_index)
+            if SCHEDULER.done:
+                break
+    print("Candidates per slot:", SCHEDULER.counts)
 
 # g = Grid()
 # g.display()